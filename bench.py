@@ -0,0 +1,346 @@
+# ===============================================================================
+# ⏱️ BENCHMARK OFFLINE - ligas sintéticas + dublês de Sheets, football-data.org e Telegram
+# ===============================================================================
+# Uso: python bench.py [--temporadas 1,3,10] [--chats 1,10,50] [--repeticoes 200]
+#                      [--latencia-sheets 0] [--latencia-api 0] [--saida bench_output.txt]
+# Tudo roda em processo (nenhuma chamada de rede); o SQLite vai para um diretório temporário.
+# Sai com erro se alguma verificação de comportamento (motor, diff_futuros, sincronização) falhar.
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+_TMP = tempfile.mkdtemp(prefix="bench_stats_")
+os.environ["SQLITE_PATH"] = os.path.join(_TMP, "bench.db")
+os.environ.setdefault("API_RATE_LIMIT", "100000")  # o benchmark mede o bot, não o limite do plano
+
+import stats  # noqa: E402
+
+TIMES_POR_LIGA = 20
+
+# 🏟️ LIGAS SINTÉTICAS
+def gerar_liga(temporadas, seed):
+    """Turno e returno por temporada; a última temporada está na metade (metade jogada, metade agendada)."""
+    rnd = random.Random(seed)
+    times = [f"Time {i:02d}" for i in range(TIMES_POR_LIGA)]
+    hoje = datetime.now(timezone.utc).replace(hour=19, minute=0, second=0, microsecond=0)
+    rodadas = [[(a, b) for a in times for b in times if a != b][i::2 * (TIMES_POR_LIGA - 1)] for i in range(2 * (TIMES_POR_LIGA - 1))]
+    partidas, mid = [], 1
+    for t in range(temporadas):
+        atual = t == temporadas - 1
+        for r, jogos in enumerate(rodadas):
+            quando = hoje + timedelta(days=7 * (r - len(rodadas) // 2) - 365 * (temporadas - 1 - t))
+            for a, b in jogos:
+                gm1, gv1 = rnd.randint(0, 2), rnd.randint(0, 2)
+                gm, gv = gm1 + rnd.randint(0, 2), gv1 + rnd.randint(0, 2)
+                status = "FINISHED" if quando < hoje else ("IN_PLAY" if quando == hoje else "TIMED")
+                partidas.append({
+                    "id": mid, "status": status, "matchday": r + 1, "utcDate": quando.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "homeTeam": {"name": a}, "awayTeam": {"name": b}, "minute": 55 if status == "IN_PLAY" else None,
+                    "score": {"fullTime": {"home": gm, "away": gv} if status != "TIMED" else {"home": None, "away": None},
+                              "halfTime": {"home": gm1, "away": gv1} if status != "TIMED" else {"home": None, "away": None}},
+                    "temporada_atual": atual,
+                })
+                mid += 1
+    return partidas
+
+def linha_passado(m):
+    ft, ht = m["score"]["fullTime"], m["score"]["halfTime"]
+    data = datetime.strptime(m["utcDate"][:10], "%Y-%m-%d").strftime("%d/%m/%Y")
+    return [m["homeTeam"]["name"], m["awayTeam"]["name"], ft["home"], ft["away"], ht["home"], ht["away"], ft["home"] - ht["home"], ft["away"] - ht["away"], data]
+
+def abas_iniciais(ligas):
+    """Planilha como estaria antes do último refresh: a rodada finalizada mais recente ainda não foi gravada."""
+    abas = {}
+    for code, partidas in ligas.items():
+        cfg = stats.LIGAS_MAP[code]
+        fin = [m for m in partidas if m["status"] == "FINISHED"]
+        ultima = max(m["utcDate"] for m in fin)
+        abas[cfg["sheet_past"]] = [stats.COLUNAS_PASSADO] + [linha_passado(m) for m in fin if m["utcDate"] != ultima]
+        abas[cfg["sheet_future"]] = [stats.CABECALHO_FUTURO] + [[m["homeTeam"]["name"], m["awayTeam"]["name"], m["utcDate"], m["matchday"]] for m in partidas if m["status"] == "TIMED"]
+    return abas
+
+# 📄 DUBLÊ DO GSPREAD (Spreadsheet/Worksheet/Client)
+class AbaFalsa:
+    def __init__(self, title, linhas):
+        self.title, self.linhas, self.row_count = title, linhas, max(1000, len(linhas))
+
+    def add_rows(self, n): self.row_count += n
+
+class PlanilhaFalsa:
+    def __init__(self, abas, latencia):
+        self.abas = {t: AbaFalsa(t, [list(r) for r in linhas]) for t, linhas in abas.items()}
+        self.latencia, self.chamadas = latencia, 0
+
+    def _espera(self):
+        self.chamadas += 1
+        if self.latencia: time.sleep(self.latencia)
+
+    @staticmethod
+    def _intervalo(rng):
+        m = re.match(r"'((?:[^']|'')*)'(?:!(.*))?$", rng)
+        return m.group(1).replace("''", "'"), m.group(2)
+
+    def worksheets(self):
+        self._espera()
+        return list(self.abas.values())
+
+    def values_batch_get(self, ranges):
+        self._espera()
+        saida = []
+        for rng in ranges:
+            titulo, a1 = self._intervalo(rng)
+            linhas = [["" if c is None else str(c) for c in r] for r in self.abas[titulo].linhas]
+            if a1 == "A:A": linhas = [r[:1] for r in linhas]
+            while linhas and not any(linhas[-1]): linhas.pop()
+            saida.append({"range": rng, "values": linhas})
+        return {"valueRanges": saida}
+
+    def values_batch_update(self, body):
+        self._espera()
+        for d in body["data"]:
+            titulo, a1 = self._intervalo(d["range"])
+            aba, inicio = self.abas[titulo], int(re.match(r"A(\d+):", a1).group(1))
+            for i, valores in enumerate(d["values"]):
+                while len(aba.linhas) < inicio + i: aba.linhas.append([])
+                aba.linhas[inicio + i - 1] = list(valores)
+
+class ClienteFalso:
+    def __init__(self, planilha): self.planilha = planilha
+
+    def open_by_url(self, url):
+        self.planilha._espera()
+        return self.planilha
+
+# 🌐 DUBLÊ DA football-data.org (substitui stats.HTTP)
+class RespostaFalsa:
+    def __init__(self, corpo):
+        self.status_code, self.headers, self._corpo = 200, {"X-Requests-Available-Minute": "1000"}, corpo
+
+    def raise_for_status(self): pass
+
+    def json(self): return self._corpo
+
+class SessaoFalsa:
+    def __init__(self, ligas, latencia):
+        self.ligas, self.latencia, self.chamadas, self.partidas = ligas, latencia, 0, 0
+
+    def get(self, url, params=None, timeout=None):
+        self.chamadas += 1
+        if self.latencia: time.sleep(self.latencia)
+        code = url.split("/competitions/")[1].split("/")[0]
+        params = params or {}
+        partidas = self.ligas[code]
+        if "season" in params: partidas = [m for m in partidas if m["temporada_atual"]]
+        if "dateFrom" in params: partidas = [m for m in partidas if params["dateFrom"] <= m["utcDate"][:10] <= params["dateTo"]]
+        if "status" in params: partidas = [m for m in partidas if m["status"] == params["status"]]
+        self.partidas += len(partidas)
+        return RespostaFalsa({"matches": partidas})
+
+# 💬 DUBLÊS DO TELEGRAM (Update/CallbackQuery/Message/Context)
+class MensagemFalsa:
+    def __init__(self): self.markup = None
+
+    async def reply_text(self, texto, reply_markup=None, parse_mode=None):
+        if reply_markup is not None: self.markup = reply_markup
+
+class CallbackFalso:
+    def __init__(self, data, mensagem): self.data, self.mensagem = data, mensagem
+
+    async def answer(self, texto=None): pass
+
+    async def edit_message_text(self, texto, reply_markup=None, parse_mode=None):
+        if reply_markup is not None: self.mensagem.markup = reply_markup
+
+class UpdateFalso:
+    def __init__(self, data, mensagem):
+        self.callback_query, self.effective_message, self.message = CallbackFalso(data, mensagem), mensagem, None
+
+class ContextoFalso:
+    def __init__(self): self.chat_data, self.user_data, self.bot_data = {}, {}, {}
+
+class Chat:
+    """Um usuário clicando botões; guarda o último teclado recebido para escolher o próximo clique."""
+    def __init__(self): self.contexto, self.mensagem = ContextoFalso(), MensagemFalsa()
+
+    async def clicar(self, data):
+        await stats.callback_query_handler(UpdateFalso(data, self.mensagem), self.contexto)
+
+    def botoes(self, prefixo):
+        if not self.mensagem.markup: return []
+        return [b.callback_data for linha in self.mensagem.markup.inline_keyboard for b in linha if b.callback_data.startswith(prefixo)]
+
+# 📏 MEDIÇÃO
+def percentis(amostras):
+    v = sorted(amostras)
+    p = lambda q: v[min(len(v) - 1, int(q * len(v)))] * 1000
+    return f"n={len(v):5d}  p50={p(0.50):8.2f}ms  p95={p(0.95):8.2f}ms  p99={p(0.99):8.2f}ms  max={v[-1] * 1000:8.2f}ms"
+
+def medir_sync(nome, func, repeticoes, relatorio):
+    amostras, inicio = [], time.perf_counter()
+    for i in range(repeticoes):
+        t = time.perf_counter(); func(i); amostras.append(time.perf_counter() - t)
+    total = time.perf_counter() - inicio
+    relatorio(f"  {nome:<38} {repeticoes / total:10.1f} op/s  {percentis(amostras)}")
+
+async def medir_chats(nome, chats, acao, repeticoes, relatorio):
+    """Cada chat executa `acao` em sequência; os chats rodam em paralelo (usuários simultâneos no webhook)."""
+    amostras = []
+    async def rodar(chat):
+        for i in range(repeticoes):
+            t = time.perf_counter(); await acao(chat, i); amostras.append(time.perf_counter() - t)
+    inicio = time.perf_counter()
+    await asyncio.gather(*(rodar(c) for c in chats))
+    total = time.perf_counter() - inicio
+    relatorio(f"  {nome:<38} {len(amostras) / total:10.1f} op/s  {percentis(amostras)}")
+
+def resetar_estado(ligas, args):
+    """Processo 'recém-iniciado': caches vazios, SQLite apagado, planilha e API falsas novas."""
+    for arq in os.listdir(_TMP): os.remove(os.path.join(_TMP, arq))
+    stats._DB_PRONTO = False
+    stats.invalidar_cache_dados()
+    stats.descartar_planilha()
+    stats.SYNC_MARCAS.clear(); stats.LIVE_SNAPSHOT.clear(); stats.TABELA_JOGOS.clear(); stats.LISTAS_JOGOS.clear()
+    planilha = PlanilhaFalsa(abas_iniciais(ligas), args.latencia_sheets / 1000)
+    stats.client = ClienteFalso(planilha)
+    stats.HTTP = SessaoFalsa(ligas, args.latencia_api / 1000)
+    return planilha
+
+# ✅ VERIFICAÇÕES DE COMPORTAMENTO (a sincronização reescreve a planilha do usuário)
+FALHAS = []
+
+def verificar(nome, ok, relatorio):
+    relatorio(f"  {nome}: {'OK' if ok else 'FALHOU'}")
+    if not ok: FALHAS.append(nome)
+
+def verificar_diff_futuros(relatorio):
+    """Linha inalterada (matchday texto x int), alteração, remoção e reaproveitamento de linhas vagas antes do append."""
+    atuais = [["A", "B", "d1", "1"], ["C", "D", "d2", "1"], ["", "", "", ""], ["E", "F", "d3", "2"]]  # linhas 2..5 da aba
+    novos = [["A", "B", "d1", 1], ["C", "D", "d2x", 1], ["G", "H", "d4", 3], ["I", "J", "d5", 3], ["K", "L", "d6", 4]]
+    esperado = [(3, ["C", "D", "d2x", 1]), (4, ["G", "H", "d4", 3]), (5, ["I", "J", "d5", 3]), (6, ["K", "L", "d6", 4])]
+    verificar("diff_futuros (mantém, altera, remove, reaproveita linha vaga)", stats.diff_futuros(atuais, novos) == esperado, relatorio)
+    so_remocao = stats.diff_futuros(atuais, [["A", "B", "d1", 1]])
+    verificar("diff_futuros (remoção vira linha vazia)", so_remocao == [(3, [""] * 4), (5, [""] * 4)], relatorio)
+
+async def verificar_sincronizacao(ligas, args, relatorio):
+    """Ponta a ponta na planilha falsa: _FJ igual aos jogos agendados da API, sem duplicar a aba de resultados."""
+    planilha = resetar_estado(ligas, args)
+    cfg = stats.LIGAS_MAP["BSA"]
+    agendados = lambda: sorted(tuple(r[:3]) for r in planilha.abas[cfg["sheet_future"]].linhas[1:] if any(r))
+    api = sorted((m["homeTeam"]["name"], m["awayTeam"]["name"], m["utcDate"]) for m in ligas["BSA"] if m["status"] == "TIMED")
+    finalizados = sum(1 for m in ligas["BSA"] if m["status"] == "FINISHED")
+    aba_fj = planilha.abas[cfg["sheet_future"]].linhas
+    del aba_fj[2]; aba_fj[3] = [""] * 4; aba_fj.append(["X", "Y", "2099-01-01T00:00:00Z", 99])  # some, vaga e jogo que saiu
+    await stats.atualizar_planilhas(ligas=["BSA"])
+    verificar("sync incremental: _FJ igual à API", agendados() == api, relatorio)
+    await stats.atualizar_planilhas(completo=True, ligas=["BSA"])
+    verificar("sync completo: sem linhas duplicadas", len(planilha.abas[cfg["sheet_past"]].linhas) == finalizados + 1 and agendados() == api, relatorio)
+    planilha.abas[cfg["sheet_past"]].linhas.pop()  # edição manual na planilha
+    await stats.atualizar_planilhas(completo=True, ligas=["BSA"])
+    verificar("sync completo: reimporta edição manual", len(stats.get_sheet_data("BSA")) == finalizados and len(stats.db_ler_passado("BSA")) == finalizados, relatorio)
+
+async def bench_tamanho(temporadas, args, relatorio):
+    ligas = {code: gerar_liga(temporadas, seed=i) for i, code in enumerate(stats.LIGAS_MAP)}
+    n = sum(1 for m in ligas["BSA"] if m["status"] == "FINISHED")
+    relatorio(f"\n=== {temporadas} temporada(s) | {n} jogos finalizados por liga | {len(ligas)} ligas ===")
+    planilha = resetar_estado(ligas, args)
+    times = sorted({m["homeTeam"]["name"] for m in ligas["BSA"]})
+
+    relatorio("[carga]")
+    t = time.perf_counter(); stats.get_sheet_data("BSA")
+    relatorio(f"  {'carga fria (planilha, lote único)':<38} {(time.perf_counter() - t) * 1000:10.1f} ms  chamadas_sheets={planilha.chamadas}")
+    stats.invalidar_cache_dados()
+    t = time.perf_counter(); stats.get_sheet_data("BSA")
+    relatorio(f"  {'restart morno (SQLite)':<38} {(time.perf_counter() - t) * 1000:10.1f} ms")
+
+    relatorio("[estatísticas]")
+    divergentes = sum(
+        stats.calcular_estatisticas_time(tm, "BSA", ult, cf) != stats.calcular_estatisticas_time_loop(tm, "BSA", ult, cf)
+        for tm in times for _, _, ult, cm, cv in stats.CONFRONTO_FILTROS for cf in (cm, cv)
+    )
+    verificar("motor vetorizado x laço de referência", not divergentes, relatorio)
+    r = args.repeticoes
+    filtro = lambda i: stats.CONFRONTO_FILTROS[i % len(stats.CONFRONTO_FILTROS)]
+    medir_sync("calcular_estatisticas_time", lambda i: stats.calcular_estatisticas_time(times[i % len(times)], "BSA", filtro(i)[2], filtro(i)[3]), r, relatorio)
+    medir_sync("calcular_estatisticas_time_loop", lambda i: stats.calcular_estatisticas_time_loop(times[i % len(times)], "BSA", filtro(i)[2], filtro(i)[3]), r, relatorio)
+    medir_sync("listar_ultimos_jogos", lambda i: stats.listar_ultimos_jogos(times[i % len(times)], "BSA", filtro(i)[2], filtro(i)[3]), r, relatorio)
+    medir_sync("estatisticas_filtro (cache quente)", lambda i: stats.estatisticas_filtro(times[i % 4], "BSA", i % len(stats.CONFRONTO_FILTROS), "m"), r, relatorio)
+    metricas = list(stats.RANKING_METRICAS)
+    medir_sync("ranking (liga inteira)", lambda i: stats.ranking("BSA", metricas[i % len(metricas)], filtro(i)[2], filtro(i)[3]), r, relatorio)
+    medir_sync("confronto_direto", lambda i: stats.confronto_direto(times[i % len(times)], times[(i + 1) % len(times)], "BSA"), r, relatorio)
+    medir_sync("construir_indice + construir_motor", lambda i: stats.construir_motor(stats.construir_indice(stats.get_sheet_data("BSA"))), max(1, r // 20), relatorio)
+
+    for n_chats in args.chats:
+        relatorio(f"[handlers | {n_chats} chat(s) simultâneo(s)]")
+        chats = [Chat() for _ in range(n_chats)]
+        await medir_chats("c|<liga>", chats, lambda c, i: c.clicar("c|BSA"), r // n_chats or 1, relatorio)
+        await medir_chats("STATUS|FUTURE", chats, lambda c, i: c.clicar("STATUS|FUTURE|BSA"), r // n_chats or 1, relatorio)
+        stats.LIVE_SNAPSHOT.clear()
+        await medir_chats("STATUS|LIVE", chats, lambda c, i: c.clicar("STATUS|LIVE|BSA"), r // n_chats or 1, relatorio)
+
+        async def abrir_jogo(c, i):
+            await c.clicar("STATUS|FUTURE|BSA")
+            jogos = c.botoes("J")
+            await c.clicar(jogos[i % len(jogos)])
+        await medir_chats("STATUS|FUTURE + jogo", chats, abrir_jogo, r // n_chats or 1, relatorio)
+
+        async def clicar_filtro(prefixo):
+            async def acao(c, i):
+                botoes = c.botoes(prefixo)
+                await c.clicar(botoes[i % len(botoes)])
+            return acao
+        await medir_chats("STATS_FILTRO", chats, await clicar_filtro("STATS_FILTRO|"), r // n_chats or 1, relatorio)
+        await medir_chats("RESULTADOS_FILTRO", chats, await clicar_filtro("RESULTADOS_FILTRO|"), r // n_chats or 1, relatorio)
+
+        # Latência dos cliques enquanto um refresh completo roda em paralelo (o loop não pode travar)
+        resetar_estado(ligas, args)
+        stats.get_sheet_data("BSA")
+        refresh = asyncio.ensure_future(stats.atualizar_planilhas(completo=True))
+        await medir_chats("STATS_FILTRO durante refresh", chats, lambda c, i: c.clicar(c.botoes("STATS_FILTRO|")[0]) if c.botoes("STATS_FILTRO|") else c.clicar("c|BSA"), r // n_chats or 1, relatorio)
+        await refresh
+
+    relatorio("[sincronização]")
+    await verificar_sincronizacao(ligas, args, relatorio)
+
+    relatorio("[refresh]")
+    planilha = resetar_estado(ligas, args)
+    stats.get_sheet_data("BSA"); stats.get_sheet_data("BL1")
+    for modo, completo in (("incremental", False), ("incremental sem novidades", False), ("completo", True)):
+        antes_api, antes_partidas, antes_sheets = stats.HTTP.chamadas, stats.HTTP.partidas, planilha.chamadas
+        t = time.perf_counter(); ok = await stats.atualizar_planilhas(completo=completo)
+        relatorio(f"  {'atualizar_planilhas (' + modo + ')':<48} {(time.perf_counter() - t) * 1000:10.1f} ms  ok={ok}  "
+                  f"chamadas_api={stats.HTTP.chamadas - antes_api}  partidas_api={stats.HTTP.partidas - antes_partidas}  chamadas_sheets={planilha.chamadas - antes_sheets}")
+
+async def principal(args):
+    linhas = []
+    def relatorio(texto):
+        print(texto, flush=True)
+        linhas.append(texto)
+    relatorio(f"Benchmark stats.py | python {sys.version.split()[0]} | latência simulada: sheets={args.latencia_sheets}ms api={args.latencia_api}ms")
+    relatorio("[verificações]")
+    verificar_diff_futuros(relatorio)
+    for temporadas in args.temporadas: await bench_tamanho(temporadas, args, relatorio)
+    relatorio(f"\n[agendador da API] {stats.AGENDADOR_API.estado()}")
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f: f.write("\n".join(linhas) + "\n")
+    if FALHAS: sys.exit(f"❌ {len(FALHAS)} verificação(ões) falharam: {', '.join(FALHAS)}")
+
+def main():
+    lista = lambda s: [int(x) for x in s.split(",") if x]
+    p = argparse.ArgumentParser(description="Benchmark offline dos caminhos quentes do bot.")
+    p.add_argument("--temporadas", type=lista, default=[1, 3, 10], help="tamanhos das ligas sintéticas (temporadas de 380 jogos)")
+    p.add_argument("--chats", type=lista, default=[1, 10, 50], help="quantidades de chats simultâneos")
+    p.add_argument("--repeticoes", type=int, default=200)
+    p.add_argument("--latencia-sheets", type=float, default=0.0, help="ms por chamada à planilha falsa")
+    p.add_argument("--latencia-api", type=float, default=0.0, help="ms por chamada à API falsa")
+    p.add_argument("--saida", default=None, help="também grava o relatório neste arquivo (ex.: bench_output.txt)")
+    asyncio.run(principal(p.parse_args()))
+
+if __name__ == "__main__":
+    main()
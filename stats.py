@@ -2,19 +2,32 @@
 # 🏆 BOT DE ESTATÍSTICAS DE CONFRONTO V2.5.0 - BSA & BL1
 # ===============================================================================
 
+import time
+INICIO_PROCESSO = time.monotonic()  # antes dos imports pesados: base do tempo até a primeira resposta
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import requests
 import os 
-import tempfile
+import json
+import hashlib
 import asyncio
 import logging
+import functools
+import itertools
+from collections import OrderedDict, deque, Counter
+import sqlite3
+import threading
+from contextlib import contextmanager, AsyncExitStack
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta, timezone
-import nest_asyncio
+from typing import NamedTuple
 import sys 
+import numpy as np
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, JobQueue 
+from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, JobQueue, TypeHandler
 from telegram.error import BadRequest
 from gspread.exceptions import WorksheetNotFound
 
@@ -22,23 +35,41 @@ from gspread.exceptions import WorksheetNotFound
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
-nest_asyncio.apply()
 
 # ===== Variáveis de Configuração =====
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "SEU_TOKEN_AQUI") 
 API_KEY = os.environ.get("API_KEY", "SUA_API_KEY_AQUI")
 SHEET_URL = os.environ.get("SHEET_URL", "SUA_URL_DA_PLANILHA_AQUI")
 
-# Mapeamento de Ligas (BSA e Bundesliga Adicionada)
-LIGAS_MAP = {
+# Mapeamento de Ligas: padrão BSA e Bundesliga; LIGAS_FILE (caminho de um JSON) ou LIGAS_CONFIG (o JSON na própria env)
+# substituem a lista, ex.: {"PL": {"season": "2025"}, "BSA": {"season": "2026", "sheet_past": "BSA", "sheet_future": "BSA_FJ"}}
+LIGAS_PADRAO = {
     "BSA": {"sheet_past": "BSA", "sheet_future": "BSA_FJ", "season": "2026"},
     "BL1": {"sheet_past": "BL1", "sheet_future": "BL1_FJ", "season": "2025"}
 }
+
+def carregar_ligas():
+    """Registro de ligas vindo de LIGAS_FILE/LIGAS_CONFIG; abas ausentes viram <código> e <código>_FJ."""
+    caminho, bruto = os.environ.get("LIGAS_FILE"), os.environ.get("LIGAS_CONFIG")
+    if caminho:
+        with open(caminho, encoding="utf-8") as f: bruto = f.read()
+    if not bruto: return dict(LIGAS_PADRAO)
+    ligas = {}
+    for code, cfg in json.loads(bruto).items():
+        if not isinstance(cfg, dict) or not cfg.get("season"): raise ValueError(f"Liga {code}: 'season' é obrigatório")
+        ligas[code] = {"sheet_past": cfg.get("sheet_past", code), "sheet_future": cfg.get("sheet_future", f"{code}_FJ"), "season": str(cfg["season"])}
+    if not ligas: raise ValueError("Nenhuma liga configurada")
+    return ligas
+
+LIGAS_MAP = carregar_ligas()
 ABAS_PASSADO = list(LIGAS_MAP.keys())
 
 ULTIMOS = 10
 SHEET_CACHE = {}
 CACHE_DURATION_SECONDS = 3600 
+VERSAO_DADOS = 0  # gerador de versões (nunca se repetem); cada liga guarda a sua no SHEET_CACHE
+RENDER_CACHE = OrderedDict()  # (tipo, liga, time, filtro, lado, versão) -> resultado pronto
+RENDER_CACHE_MAX = 4096
 MAX_GAMES_LISTED = 30
 
 CONFRONTO_FILTROS = [
@@ -53,27 +84,45 @@ CONFRONTO_FILTROS = [
 ]
 
 LIVE_STATUSES = ["IN_PLAY", "HALF_TIME", "PAUSED"]
+COLUNAS_PASSADO = ["Mandante", "Visitante", "Gols Mandante", "Gols Visitante", "Gols Mandante 1T", "Gols Visitante 1T", "Gols Mandante 2T", "Gols Visitante 2T", "Data"]
+CABECALHO_FUTURO = ['Mandante', 'Visitante', 'Data/Hora', 'Matchday']
+
+# ⚙️ I/O NÃO BLOQUEANTE: sessão HTTP persistente + pools limitados (gspread e requests são síncronos)
+API_BASE = "https://api.football-data.org/v4"
+SHEETS_WORKERS = int(os.environ.get("SHEETS_WORKERS", "4"))
+API_WORKERS = int(os.environ.get("API_WORKERS", "4"))
+EXECUTOR_SHEETS = ThreadPoolExecutor(max_workers=SHEETS_WORKERS, thread_name_prefix="sheets")
+EXECUTOR_API = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="api")
+HTTP = requests.Session()
+HTTP.headers.update({"X-Auth-Token": API_KEY})
+HTTP.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=API_WORKERS))
 
-# ✅ CONEXÃO GSHEETS
+# ✅ CONEXÃO GSHEETS (preguiçosa: autoriza no primeiro acesso à planilha, nunca no import nem antes do webhook)
 CREDS_JSON = os.environ.get("GSPREAD_CREDS_JSON")
 client = None
+_CLIENT_LOCK = threading.Lock()
 
 if not CREDS_JSON:
     logging.error("❌ ERRO DE AUTORIZAÇÃO GSHEET: Variável GSPREAD_CREDS_JSON não encontrada.")
-else:
-    try:
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, encoding='utf-8') as tmp_file:
-            tmp_file.write(CREDS_JSON)
-            tmp_file_path = tmp_file.name
-        
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        creds = ServiceAccountCredentials.from_json_keyfile_name(tmp_file_path, scope)
-        client = gspread.authorize(creds)
-        logging.info("✅ Conexão GSheets estabelecida.")
-        os.remove(tmp_file_path)
-    except Exception as e:
-        logging.error(f"❌ ERRO GSHEET: {e}")
-        client = None
+
+def sheets_configurado():
+    return client is not None or bool(CREDS_JSON)
+
+def get_client():
+    global client
+    with _CLIENT_LOCK:
+        if client is None:
+            if not CREDS_JSON: raise Exception("Cliente GSheets não autorizado.")
+            try:
+                with cronometro("bot_upstream", upstream="google_auth", op="authorize"):
+                    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+                    creds = ServiceAccountCredentials.from_json_keyfile_dict(json.loads(CREDS_JSON), scope)
+                    client = gspread.authorize(creds)
+                logging.info("✅ Conexão GSheets estabelecida.")
+            except Exception as e:
+                logging.error(f"❌ ERRO GSHEET: {e}")
+                raise
+        return client
 
 # 💾 FUNÇÕES DE SUPORTE
 def safe_int(v):
@@ -89,49 +138,502 @@ def media(part, total):
 def escape_markdown(text):
     return str(text).replace('*', '\\*').replace('_', '\\_').replace('[', '\\[') .replace(']', '\\]')
 
-def get_sheet_data(aba_code):
-    global SHEET_CACHE
-    agora = datetime.now()
+# 📊 MÉTRICAS: histogramas de latência e contadores em memória (/perf e texto no formato Prometheus)
+ADMIN_IDS = {int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x.strip().isdecimal()}
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # 0 = endpoint /metrics desligado
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+HISTOGRAMAS = {}  # (nome, rótulos) -> {"buckets": [n por faixa, +Inf no fim], "soma": s, "n": n}
+CONTADORES = Counter()  # (nome, rótulos) -> total
+_METRICAS_LOCK = threading.Lock()
+
+def _rotulos(rotulos):
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+def observar(nome, segundos, **rotulos):
+    chave = (nome, _rotulos(rotulos))
+    with _METRICAS_LOCK:
+        h = HISTOGRAMAS.get(chave)
+        if h is None: h = HISTOGRAMAS[chave] = {"buckets": [0] * (len(BUCKETS_LATENCIA) + 1), "soma": 0.0, "n": 0}
+        h["buckets"][next((i for i, le in enumerate(BUCKETS_LATENCIA) if segundos <= le), len(BUCKETS_LATENCIA))] += 1
+        h["soma"] += segundos
+        h["n"] += 1
+
+def contar(nome, n=1, **rotulos):
+    with _METRICAS_LOCK: CONTADORES[(nome, _rotulos(rotulos))] += n
+
+@contextmanager
+def cronometro(nome, **rotulos):
+    """Mede o bloco em <nome>_segundos; exceções contam em <nome>_erros_total por classe e seguem adiante."""
+    inicio = time.perf_counter()
+    try: yield
+    except Exception as e:
+        contar(f"{nome}_erros_total", classe=type(e).__name__, **rotulos)
+        raise
+    finally: observar(f"{nome}_segundos", time.perf_counter() - inicio, **rotulos)
+
+def medido(nome):
+    """Decorator para handlers assíncronos: latência em bot_handler_segundos{handler=nome}."""
+    def decorador(func):
+        @functools.wraps(func)
+        async def envolvido(*args, **kwargs):
+            with cronometro("bot_handler", handler=nome): return await func(*args, **kwargs)
+        return envolvido
+    return decorador
+
+def registrar_erro(local, e):
+    contar("bot_erros_total", local=local, classe=type(e).__name__)
+    logging.warning(f"⚠️ {local}: {type(e).__name__}: {e}")
+
+def quantil_buckets(h, q):
+    """Limite superior da faixa que contém o quantil q (estimativa a partir do histograma)."""
+    alvo, acumulado = q * h["n"], 0
+    for i, n in enumerate(h["buckets"]):
+        acumulado += n
+        if acumulado >= alvo and acumulado > 0: return BUCKETS_LATENCIA[i] if i < len(BUCKETS_LATENCIA) else float("inf")
+    return float("inf")
+
+# 🗂️ ÍNDICE DE PARTIDAS (construído a cada carga do SHEET_CACHE)
+class Partida(NamedTuple):
+    mandante: str
+    visitante: str
+    gm: int
+    gv: int
+    gm1: int
+    gv1: int
+    data: datetime
+    data_txt: str
+
+def construir_indice(linhas):
+    """Converte as linhas da aba em Partidas ordenadas por data e indexadas por time/mando."""
+    partidas = []
+    for l in linhas:
+        try: data = datetime.strptime(str(l['Data']), "%d/%m/%Y")
+        except (KeyError, ValueError): continue
+        partidas.append(Partida(
+            str(l['Mandante']), str(l['Visitante']),
+            safe_int(l['Gols Mandante']), safe_int(l['Gols Visitante']),
+            safe_int(l['Gols Mandante 1T']), safe_int(l['Gols Visitante 1T']),
+            data, str(l['Data'])
+        ))
+    partidas.sort(key=lambda p: p.data)  # sort estável: empates mantêm a ordem da planilha
+
+    times, confrontos = {}, {}
+    for p in partidas:
+        times.setdefault(p.mandante, {"casa": [], "fora": [], "todos": []})
+        times.setdefault(p.visitante, {"casa": [], "fora": [], "todos": []})
+        times[p.mandante]["casa"].append(p); times[p.mandante]["todos"].append(p)
+        times[p.visitante]["fora"].append(p)
+        if p.visitante != p.mandante: times[p.visitante]["todos"].append(p)
+        confrontos.setdefault(chave_confronto(p.mandante, p.visitante), []).append(p)
+    return {"partidas": partidas, "times": times, "confrontos": confrontos}
+
+def chave_confronto(a, b):
+    return (a, b) if a <= b else (b, a)
+
+def invalidar_cache_dados():
+    global VERSAO_DADOS
+    SHEET_CACHE.clear()  # esvazia o mesmo dict: quem já leu uma entrada continua com ela
+    VERSAO_DADOS += 1
+    RENDER_CACHE.clear()
+
+# 🗄️ ESPELHO LOCAL (SQLite): leitura rápida após restart; a planilha segue como destino de exportação
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "bot_stats.db")
+_DB_LOCK = threading.Lock()
+_DB_PRONTO = False
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS jogos (
+    liga TEXT NOT NULL, mandante TEXT NOT NULL, visitante TEXT NOT NULL,
+    gm INTEGER, gv INTEGER, gm1 INTEGER, gv1 INTEGER, gm2 INTEGER, gv2 INTEGER,
+    data TEXT NOT NULL, data_txt TEXT NOT NULL,
+    PRIMARY KEY (liga, mandante, visitante, data_txt)
+);
+CREATE INDEX IF NOT EXISTS jogos_liga_data ON jogos (liga, data);
+DROP INDEX IF EXISTS jogos_mandante_data;
+DROP INDEX IF EXISTS jogos_visitante_data;
+CREATE TABLE IF NOT EXISTS futuros (
+    liga TEXT NOT NULL, mandante TEXT NOT NULL, visitante TEXT NOT NULL,
+    data_hora TEXT, matchday INTEGER,
+    PRIMARY KEY (liga, mandante, visitante)
+);
+CREATE INDEX IF NOT EXISTS futuros_liga_data ON futuros (liga, data_hora);
+CREATE TABLE IF NOT EXISTS espelho (aba TEXT PRIMARY KEY, atualizado_em TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS sync (liga TEXT PRIMARY KEY, data TEXT NOT NULL, match_id INTEGER);
+"""
+
+@contextmanager
+def db():
+    """Conexão curta por operação (as chamadas vêm de várias threads do pool); commit/rollback automático."""
+    global _DB_PRONTO
+    conn = sqlite3.connect(SQLITE_PATH, timeout=30)
+    try:
+        if not _DB_PRONTO:
+            with _DB_LOCK:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA_SQL)
+                _DB_PRONTO = True
+        with conn: yield conn
+    finally: conn.close()
+
+def db_marcar_espelho(conn, aba_name):
+    conn.execute("INSERT OR REPLACE INTO espelho (aba, atualizado_em) VALUES (?, ?)", (aba_name, datetime.now(timezone.utc).isoformat()))
+
+def db_gravar_passado(aba_code, registros, substituir=False):
+    linhas = []
+    for r in registros:
+        try: data = datetime.strptime(str(r['Data']), "%d/%m/%Y").date().isoformat()
+        except (KeyError, ValueError): continue
+        gm, gv, gm1, gv1 = (safe_int(r[c]) for c in COLUNAS_PASSADO[2:6])
+        linhas.append((aba_code, str(r['Mandante']), str(r['Visitante']), gm, gv, gm1, gv1, gm - gm1, gv - gv1, data, str(r['Data'])))
+    with db() as conn:
+        if substituir: conn.execute("DELETE FROM jogos WHERE liga = ?", (aba_code,))
+        conn.executemany("INSERT OR REPLACE INTO jogos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", linhas)
+        db_marcar_espelho(conn, LIGAS_MAP[aba_code]['sheet_past'])
+
+def db_ler_passado(aba_code):
+    """Linhas da aba no formato de get_all_records, já em ordem cronológica; None se a aba nunca foi espelhada."""
+    with db() as conn:
+        if not conn.execute("SELECT 1 FROM espelho WHERE aba = ?", (LIGAS_MAP[aba_code]['sheet_past'],)).fetchone(): return None
+        cur = conn.execute("SELECT mandante, visitante, gm, gv, gm1, gv1, gm2, gv2, data_txt FROM jogos WHERE liga = ? ORDER BY data", (aba_code,))
+        return [dict(zip(COLUNAS_PASSADO, r)) for r in cur]
+
+def db_gravar_futuros(aba_code, linhas):
+    with db() as conn:
+        conn.execute("DELETE FROM futuros WHERE liga = ?", (aba_code,))
+        conn.executemany("INSERT OR REPLACE INTO futuros VALUES (?, ?, ?, ?, ?)", [(aba_code, str(r[0]), str(r[1]), r[2], safe_int(r[3])) for r in linhas if r[0]])
+        db_marcar_espelho(conn, LIGAS_MAP[aba_code]['sheet_future'])
+
+def db_ler_futuros(aba_code):
+    with db() as conn:
+        if not conn.execute("SELECT 1 FROM espelho WHERE aba = ?", (LIGAS_MAP[aba_code]['sheet_future'],)).fetchone(): return None
+        cur = conn.execute("SELECT mandante, visitante, data_hora, matchday FROM futuros WHERE liga = ? ORDER BY data_hora", (aba_code,))
+        return [{"Mandante_Nome": r[0], "Visitante_Nome": r[1], "Data_Hora": r[2], "Matchday": r[3]} for r in cur]
+
+def db_gravar_marca(aba_code, marca):
+    with db() as conn:
+        conn.execute("INSERT OR REPLACE INTO sync (liga, data, match_id) VALUES (?, ?, ?)", (aba_code, marca["data"].isoformat(), marca["id"]))
+
+def db_ler_marca(aba_code):
+    with db() as conn:
+        r = conn.execute("SELECT data, match_id FROM sync WHERE liga = ?", (aba_code,)).fetchone()
+    return {"data": datetime.strptime(r[0], "%Y-%m-%d").date(), "id": r[1]} if r else None
+
+def espelho_seguro(func, *args):
+    """Falha no disco local não pode derrubar a leitura/sincronização: registra e segue pela planilha."""
+    try: return func(*args)
+    except sqlite3.Error as e:
+        registrar_erro(f"sqlite:{func.__name__}", e)
+        return None
+
+# 📡 GATEWAY DA PLANILHA: handle e metadados das abas reaproveitados, leituras e escritas em lote
+_PLANILHA = None
+_ABAS = {}  # título -> Worksheet (id, row_count)
+_PLANILHA_LOCK = threading.Lock()
+_CARGA_LOCK = threading.Lock()
+FOLGA_LINHAS = 500  # ao crescer a grade de uma aba, já reserva linhas para as próximas escritas
+
+def planilha():
+    global _PLANILHA, _ABAS
+    with _PLANILHA_LOCK:
+        if _PLANILHA is None:
+            cliente = get_client()
+            with cronometro("bot_upstream", upstream="sheets", op="open"):
+                sh = cliente.open_by_url(SHEET_URL)
+                _ABAS = {ws.title: ws for ws in sh.worksheets()}
+            _PLANILHA = sh
+        return _PLANILHA
+
+def descartar_planilha():
+    """Esquece handle e metadados (abas criadas/renomeadas, grade alterada); a próxima chamada reabre."""
+    global _PLANILHA, _ABAS
+    with _PLANILHA_LOCK: _PLANILHA, _ABAS = None, {}
+
+def aba_ws(titulo):
+    planilha()
+    if titulo not in _ABAS: raise WorksheetNotFound(titulo)
+    return _ABAS[titulo]
+
+def intervalo(titulo, a1=None):
+    nome = "'" + titulo.replace("'", "''") + "'"
+    return f"{nome}!{a1}" if a1 else nome
+
+def ler_intervalos(intervalos):
+    """Uma única chamada values:batchGet; devolve as linhas de cada intervalo, na mesma ordem."""
+    sh = planilha()
+    with cronometro("bot_upstream", upstream="sheets", op="batch_get"): resp = sh.values_batch_get(intervalos)
+    return [vr.get("values", []) for vr in resp.get("valueRanges", [])]
+
+def escrever_intervalos(escritas):
+    """escritas: [(título, linha_inicial, linhas)] de quaisquer abas/ligas, enviadas numa única values:batchUpdate."""
+    if not escritas: return
+    fim = {}
+    for titulo, linha, valores in escritas: fim[titulo] = max(fim.get(titulo, 0), linha + len(valores) - 1)
+    for titulo, ultima in fim.items():
+        ws = aba_ws(titulo)
+        if ultima > ws.row_count:
+            with cronometro("bot_upstream", upstream="sheets", op="add_rows"): ws.add_rows(ultima - ws.row_count + FOLGA_LINHAS)
+    dados = [{"range": intervalo(t, f"A{l}:{chr(64 + len(v[0]))}{l + len(v) - 1}"), "values": v} for t, l, v in escritas]
+    sh = planilha()
+    with cronometro("bot_upstream", upstream="sheets", op="batch_update"): sh.values_batch_update({"valueInputOption": "RAW", "data": dados})
+
+def registros_passado(valores):
+    """Equivalente a get_all_records() a partir das linhas cruas de uma aba."""
+    if not valores: return []
+    cab = valores[0]
+    return [dict(zip(cab, (r + [""] * len(cab))[:len(cab)])) for r in valores[1:] if any(r)]
+
+def jogos_futuros(linhas):
+    jogos = [{"Mandante_Nome": r[0], "Visitante_Nome": r[1], "Data_Hora": r[2], "Matchday": safe_int(r[3])} for r in linhas if r[0]]
+    return sorted(jogos, key=lambda j: j["Data_Hora"])  # a sincronização incremental reaproveita linhas vagas
+
+def guardar_passado(aba_code, linhas, timestamp=None):
+    global VERSAO_DADOS
+    indice = construir_indice(linhas)
+    VERSAO_DADOS += 1  # só esta liga muda de versão: o RENDER_CACHE das outras continua válido
+    SHEET_CACHE[LIGAS_MAP[aba_code]['sheet_past']] = { 'data': linhas, 'timestamp': timestamp or datetime.now(), 'indice': indice, 'motor': construir_motor(indice), 'versao': VERSAO_DADOS }
+
+def guardar_futuros(aba_code, jogos):
+    SHEET_CACHE[LIGAS_MAP[aba_code]['sheet_future']] = { 'data': jogos, 'timestamp': datetime.now() }
+
+def carregar_da_planilha(ligas=None):
+    """Lê de uma vez as abas passadas e futuras das ligas (todas por padrão), espelha no SQLite e troca as entradas
+    do SHEET_CACHE por entradas novas já prontas (leitores nunca veem uma liga pela metade ou ausente).
+    Aba configurada que não existe fica fora do cache e do espelho: não pode virar uma liga "vazia" já espelhada."""
+    planilha()
+    ligas = {aba_code: LIGAS_MAP[aba_code] for aba_code in (ligas or LIGAS_MAP)}
+    configurados = [t for cfg in ligas.values() for t in (cfg['sheet_past'], cfg['sheet_future'])]
+    if any(t not in _ABAS for t in configurados):  # pode ter sido criada depois que os metadados foram lidos
+        descartar_planilha()
+        planilha()
+    titulos = [t for t in configurados if t in _ABAS]
+    valores = dict(zip(titulos, ler_intervalos([intervalo(t) for t in titulos]))) if titulos else {}
+    for aba_code, cfg in ligas.items():
+        if cfg['sheet_past'] in valores:
+            passado = registros_passado(valores[cfg['sheet_past']])
+            espelho_seguro(db_gravar_passado, aba_code, passado, True)
+            guardar_passado(aba_code, passado)
+        if cfg['sheet_future'] in valores:
+            futuros = [(r + [""] * 4)[:4] for r in valores[cfg['sheet_future']][1:]]
+            espelho_seguro(db_gravar_futuros, aba_code, futuros)
+            guardar_futuros(aba_code, jogos_futuros(futuros))
+
+def entrada_valida(aba_name):
+    """Entrada do SHEET_CACHE lida uma única vez (outra thread pode trocá-la a qualquer momento); None se ausente/expirada."""
+    entrada = SHEET_CACHE.get(aba_name)
+    if entrada is not None and (datetime.now() - entrada['timestamp']).total_seconds() < CACHE_DURATION_SECONDS: return entrada
+    return None
+
+def entrada_passado(aba_code):
     aba_name = LIGAS_MAP[aba_code]['sheet_past']
+    entrada = entrada_valida(aba_name)
+    if entrada is not None:
+        contar("bot_sheet_cache_total", aba=aba_name, resultado="hit")
+        return entrada
+    contar("bot_sheet_cache_total", aba=aba_name, resultado="miss")
+    with _CARGA_LOCK:
+        entrada = entrada_valida(aba_name)
+        if entrada is None:
+            linhas = espelho_seguro(db_ler_passado, aba_code)
+            if linhas is not None: guardar_passado(aba_code, linhas)
+            else: carregar_da_planilha()
+            contar("bot_sheet_cache_cargas_total", aba=aba_name, origem="sqlite" if linhas is not None else "planilha")
+            entrada = entrada_valida(aba_name)
+            if entrada is None: raise WorksheetNotFound(aba_name)
+    return entrada
+
+def get_sheet_data(aba_code):
+    return entrada_passado(aba_code)['data']
+
+def get_indice(aba_code):
+    return entrada_passado(aba_code)['indice']
 
-    if aba_name in SHEET_CACHE:
-        if (agora - SHEET_CACHE[aba_name]['timestamp']).total_seconds() < CACHE_DURATION_SECONDS:
-            return SHEET_CACHE[aba_name]['data']
+def get_motor(aba_code):
+    return entrada_passado(aba_code)['motor']
 
-    if not client: raise Exception("Cliente GSheets não autorizado.")
-    sh = client.open_by_url(SHEET_URL)
-    linhas = sh.worksheet(aba_name).get_all_records()
-    SHEET_CACHE[aba_name] = { 'data': linhas, 'timestamp': agora }
-    return linhas
+def jogos_do_time(time, aba, ultimos=None, casa_fora=None):
+    """Partidas do time em ordem cronológica, já filtradas por mando e limitadas aos últimos N."""
+    grupos = get_indice(aba)["times"].get(time)
+    if not grupos: return []
+    linhas = grupos[casa_fora if casa_fora in ("casa", "fora") else "todos"]
+    return linhas[-ultimos:] if ultimos and ultimos > 0 else list(linhas)
 
 def get_sheet_data_future(aba_code):
     aba_name = LIGAS_MAP[aba_code]['sheet_future']
-    if not client: return []
     try:
-        sh = client.open_by_url(SHEET_URL)
-        linhas_raw = sh.worksheet(aba_name).get_all_values()
-        if not linhas_raw or len(linhas_raw) <= 1: return []
-        return [{"Mandante_Nome": r[0], "Visitante_Nome": r[1], "Data_Hora": r[2], "Matchday": safe_int(r[3])} for r in linhas_raw[1:] if len(r) >= 4]
-    except: return []
+        entrada = entrada_valida(aba_name)
+        if entrada is not None:
+            contar("bot_sheet_cache_total", aba=aba_name, resultado="hit")
+            return entrada['data']
+        contar("bot_sheet_cache_total", aba=aba_name, resultado="miss")
+        with _CARGA_LOCK:
+            entrada = entrada_valida(aba_name)
+            if entrada is None:
+                jogos = espelho_seguro(db_ler_futuros, aba_code)
+                if jogos is not None: guardar_futuros(aba_code, jogos)
+                else: carregar_da_planilha()
+                contar("bot_sheet_cache_cargas_total", aba=aba_name, origem="sqlite" if jogos is not None else "planilha")
+                entrada = entrada_valida(aba_name)
+                if entrada is None: raise WorksheetNotFound(aba_name)
+        return entrada['data']
+    except Exception as e:
+        registrar_erro(f"get_sheet_data_future({aba_code})", e)
+        return []
+
+async def em_thread(executor, func, *args, **kwargs):
+    """Roda uma chamada bloqueante no pool indicado sem travar o event loop."""
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+# Cargas concorrentes da mesma aba (aquecimento e requisições que chegam antes dele terminar) esperam uma só.
+# No event loop só se lê a entrada pronta; _CARGA_LOCK (que atravessa idas à planilha) é sempre tomado numa thread do pool.
+async def get_sheet_data_async(aba_code):
+    entrada = entrada_valida(LIGAS_MAP[aba_code]['sheet_past'])
+    if entrada is not None: return entrada['data']
+    return await single_flight(("carga", aba_code), lambda: em_thread(EXECUTOR_SHEETS, get_sheet_data, aba_code))
+
+async def get_sheet_data_future_async(aba_code):
+    entrada = entrada_valida(LIGAS_MAP[aba_code]['sheet_future'])
+    if entrada is not None: return entrada['data']
+    return await single_flight(("carga_fj", aba_code), lambda: em_thread(EXECUTOR_SHEETS, get_sheet_data_future, aba_code))
+
+AQUECIMENTO_CONCORRENCIA = int(os.environ.get("AQUECIMENTO_CONCORRENCIA", "4"))
 
 async def pre_carregar_cache_sheets():
-    if not client: return
-    for aba in ABAS_PASSADO:
-        try: await asyncio.to_thread(get_sheet_data, aba)
-        except: pass
-        await asyncio.sleep(1)
+    """Aquece todas as ligas (espelho SQLite se houver, senão planilha) com no máximo AQUECIMENTO_CONCORRENCIA
+    cargas simultâneas (o pool de Sheets já limita as threads)."""
+    if not sheets_configurado(): return
+    limite = asyncio.Semaphore(AQUECIMENTO_CONCORRENCIA)
+    async def aquecer(aba):
+        async with limite:
+            try: await get_sheet_data_async(aba); await get_sheet_data_future_async(aba)
+            except Exception as e: registrar_erro(f"pre_carregar({aba})", e)
+    await asyncio.gather(*(aquecer(aba) for aba in ABAS_PASSADO))
+
+# 🚦 AGENDADOR DA API: token bucket no limite por minuto, prioridades, retry em 429 e dedup de requisições iguais
+API_RATE_LIMIT = int(os.environ.get("API_RATE_LIMIT", "10"))  # plano gratuito: 10 requisições/minuto
+API_MAX_TENTATIVAS = 4
+PRIORIDADE_INTERATIVA, PRIORIDADE_AO_VIVO, PRIORIDADE_FUNDO = 0, 1, 2
+NOMES_PRIORIDADE = {PRIORIDADE_INTERATIVA: "interativa", PRIORIDADE_AO_VIVO: "ao_vivo", PRIORIDADE_FUNDO: "fundo"}
+
+def api_enviar(path, params=None):
+    return HTTP.get(f"{API_BASE}{path}", params=params, timeout=10)
+
+class AgendadorAPI:
+    """Fila única para a football-data.org. Cada requisição espera um token do balde (reposto na taxa do plano);
+    a de menor número de prioridade sai primeiro; 429 pausa a fila pelo tempo que o servidor indicar."""
+
+    def __init__(self, por_minuto):
+        self.capacidade, self.taxa = por_minuto, por_minuto / 60
+        self.tokens, self.reposto_em, self.pausa_ate = float(por_minuto), time.monotonic(), 0.0
+        self.seq = itertools.count()
+        self.loop = None
+        self.esperas = {p: deque(maxlen=500) for p in NOMES_PRIORIDADE}
+        self.contadores = Counter()
+        self.trava = threading.Lock()  # esperas/contadores são lidos pela thread de métricas em estado()
+
+    def _iniciar(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:  # fila e worker pertencem ao event loop em que foram criados
+            self.loop, self.fila, self.em_voo, self.enviando, self.tarefas = loop, asyncio.PriorityQueue(), {}, set(), set()
+            self.worker = loop.create_task(self._despachar())  # referência forte: o loop só guarda tasks por weakref
+
+    async def requisitar(self, path, params=None, prioridade=PRIORIDADE_FUNDO):
+        self._iniciar()
+        chave = (path, tuple(sorted((params or {}).items())))
+        fut, prioridade_atual = self.em_voo.get(chave, (None, None))
+        if fut is None:
+            fut = self.loop.create_future()
+            fut.add_done_callback(lambda _: self.em_voo.pop(chave, None))
+        else: self._contar("deduplicadas")
+        if prioridade_atual is None or prioridade < prioridade_atual:  # quem tem mais pressa reenfileira a mesma requisição
+            self.em_voo[chave] = (fut, prioridade)
+            self.fila.put_nowait((prioridade, next(self.seq), time.monotonic(), 1, chave, path, params, fut))
+        return await asyncio.shield(fut)
+
+    def _contar(self, chave):
+        with self.trava: self.contadores[chave] += 1
+
+    def _tokens_em(self, agora):
+        return min(self.capacidade, self.tokens + (agora - self.reposto_em) * self.taxa)
+
+    def _espera_token(self):
+        agora = time.monotonic()
+        self.tokens, self.reposto_em = self._tokens_em(agora), agora
+        if agora < self.pausa_ate: return self.pausa_ate - agora
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.taxa
+
+    async def _despachar(self):
+        while True:
+            item = await self.fila.get()
+            prioridade, _, enfileirado, tentativa, chave, path, params, fut = item
+            if fut.done() or chave in self.enviando: continue
+            espera = self._espera_token()
+            if espera > 0:
+                self.fila.put_nowait(item)  # devolve: se chegar algo mais prioritário durante a espera, passa na frente
+                await asyncio.sleep(min(espera, 1.0))
+                continue
+            self.tokens -= 1
+            with self.trava: self.esperas[prioridade].append(time.monotonic() - enfileirado)
+            self.enviando.add(chave)
+            tarefa = self.loop.create_task(self._executar(item))
+            self.tarefas.add(tarefa)
+            tarefa.add_done_callback(self.tarefas.discard)
+
+    def _ler_cabecalhos(self, headers):
+        restantes, reset = headers.get("X-Requests-Available-Minute"), headers.get("X-RequestCounter-Reset")
+        if restantes is not None:
+            self.tokens = min(self.tokens, safe_int(restantes))
+            if safe_int(restantes) <= 0 and reset is not None: self.pausa_ate = max(self.pausa_ate, time.monotonic() + safe_int(reset))
+
+    async def _executar(self, item):
+        prioridade, _, _, tentativa, chave, path, params, fut = item
+        try:
+            with cronometro("bot_upstream", upstream="football_data", prioridade=NOMES_PRIORIDADE[prioridade]):
+                r = await em_thread(EXECUTOR_API, api_enviar, path, params)
+            contar("bot_upstream_http_total", upstream="football_data", status=r.status_code)
+            self._contar("enviadas")
+            self._ler_cabecalhos(r.headers)
+            if r.status_code == 429 and tentativa < API_MAX_TENTATIVAS:
+                self._contar("429")
+                espera = safe_int(r.headers.get("X-RequestCounter-Reset")) or 5 * 2 ** tentativa
+                self.pausa_ate = max(self.pausa_ate, time.monotonic() + espera)
+                logging.warning(f"⚠️ API 429 em {path}: nova tentativa em {espera}s ({tentativa}/{API_MAX_TENTATIVAS - 1})")
+                self.fila.put_nowait((prioridade, next(self.seq), time.monotonic(), tentativa + 1, chave, path, params, fut))
+                return
+            r.raise_for_status()
+            if not fut.done(): fut.set_result(r.json())
+        except Exception as e:
+            self._contar("erros")
+            if not fut.done(): fut.set_exception(e)
+        finally: self.enviando.discard(chave)
+
+    def estado(self):
+        """Profundidade da fila e tempos de espera (s) por prioridade, para diagnóstico.
+        Chamado pela thread do servidor de métricas: só lê; o balde é calculado sem ser reposto aqui."""
+        def resumo(v):
+            v = sorted(v)
+            return {"n": len(v), "p50": v[len(v) // 2], "p95": v[int(len(v) * 0.95)], "max": v[-1]} if v else {"n": 0}
+        with self.trava: esperas, contadores = {p: list(v) for p, v in self.esperas.items()}, dict(self.contadores)
+        agora = time.monotonic()
+        return {
+            "fila": self.fila.qsize() if self.loop else 0, "em_voo": len(self.em_voo) if self.loop else 0,
+            "tokens": round(self._tokens_em(agora), 2), "pausado_por": round(max(0.0, self.pausa_ate - agora), 1),
+            "esperas": {NOMES_PRIORIDADE[p]: resumo(v) for p, v in esperas.items()}, **contadores,
+        }
+
+AGENDADOR_API = AgendadorAPI(API_RATE_LIMIT)
 
 # 🎯 FUNÇÕES DE API E ATUALIZAÇÃO
-def buscar_jogos(league_code, status_filter):
+async def api_get_async(path, params=None, prioridade=PRIORIDADE_FUNDO):
+    return await AGENDADOR_API.requisitar(path, params, prioridade)
+
+async def buscar_jogos(league_code, status_filter, janela=None):
+    """Jogos da temporada (ou só da janela (dateFrom, dateTo), se informada); None em caso de falha na API."""
     try:
-        url = f"https://api.football-data.org/v4/competitions/{league_code}/matches"
-        season = LIGAS_MAP[league_code]["season"]
-        params = {"season": season}
+        if janela: params = {"dateFrom": janela[0].isoformat(), "dateTo": janela[1].isoformat()}
+        else: params = {"season": LIGAS_MAP[league_code]["season"]}
         if status_filter != "ALL": params["status"] = status_filter
 
-        r = requests.get(url, headers={"X-Auth-Token": API_KEY}, params=params, timeout=10)
-        r.raise_for_status()
-        all_matches = r.json().get("matches", [])
+        all_matches = (await api_get_async(f"/competitions/{league_code}/matches", params)).get("matches", [])
 
         if status_filter == "ALL":
             return [m for m in all_matches if m.get('status') in ['SCHEDULED', 'TIMED']]
@@ -145,6 +647,7 @@ def buscar_jogos(league_code, status_filter):
                 gm, gv = ft.get("home", 0), ft.get("away", 0)
                 gm1, gv1 = ht.get("home", 0), ht.get("away", 0)
                 jogos.append({
+                    "ID": m.get("id"),
                     "Mandante": m.get("homeTeam", {}).get("name", ""),
                     "Visitante": m.get("awayTeam", {}).get("name", ""),
                     "Gols Mandante": gm, "Gols Visitante": gv,
@@ -153,74 +656,390 @@ def buscar_jogos(league_code, status_filter):
                     "Data": datetime.strptime(m['utcDate'][:10], "%Y-%m-%d").strftime("%d/%m/%Y")
                 })
         return sorted(jogos, key=lambda x: datetime.strptime(x['Data'], "%d/%m/%Y"))
-    except: return []
+    except Exception as e:
+        registrar_erro(f"buscar_jogos({league_code}, {status_filter})", e)
+        return None
+
+# 🔴 PLACAR AO VIVO: snapshot compartilhado, atualizado por job e com single-flight nas faltas de cache
+LIVE_POLL_SECONDS = int(os.environ.get("LIVE_POLL_SECONDS", "60"))   # com jogo rolando
+LIVE_IDLE_SECONDS = int(os.environ.get("LIVE_IDLE_SECONDS", "900"))  # sem jogo: só confere a agenda do dia
+LIVE_TICK_SECONDS = 15
+LIVE_SNAPSHOT = {}  # aba -> {"jogos": [...], "inicios": [datetime], "timestamp": datetime, "erro": str | None}
+EM_VOO = {}  # chave -> asyncio.Task em andamento
+
+async def single_flight(chave, fabrica):
+    """Chamadas concorrentes com a mesma chave aguardam uma única execução de fabrica()."""
+    task = EM_VOO.get(chave)
+    if task is None:
+        task = asyncio.ensure_future(fabrica())
+        EM_VOO[chave] = task
+        task.add_done_callback(lambda _: EM_VOO.pop(chave, None))
+    return await asyncio.shield(task)
 
-def buscar_jogos_live(league_code):
+async def consultar_jogos_live(league_code, prioridade=PRIORIDADE_INTERATIVA):
     hoje_utc = datetime.now(timezone.utc).strftime('%Y-%m-%d')
-    try:
-        url = f"https://api.football-data.org/v4/competitions/{league_code}/matches?dateFrom={hoje_utc}&dateTo={hoje_utc}"
-        r = requests.get(url, headers={"X-Auth-Token": API_KEY}, timeout=10)
-        all_matches = r.json().get("matches", [])
-        jogos = []
-        for m in all_matches:
-            if m.get('status') in LIVE_STATUSES:
-                ft = m.get("score", {}).get("fullTime", {})
-                minute = m.get("minute", "N/A")
-                if m.get('status') == 'HALF_TIME': minute = "Intervalo"
-                jogos.append({
-                    "Mandante_Nome": m.get("homeTeam", {}).get("name", ""),
-                    "Visitante_Nome": m.get("awayTeam", {}).get("name", ""),
-                    "Placar_Mandante": ft.get("home", 0), "Placar_Visitante": ft.get("away", 0),
-                    "Tempo_Jogo": minute, "Matchday": safe_int(m.get("matchday", 0))
-                })
-        return jogos
-    except: return []
+    params = {"dateFrom": hoje_utc, "dateTo": hoje_utc}
+    all_matches = (await api_get_async(f"/competitions/{league_code}/matches", params, prioridade)).get("matches", [])
+    jogos, inicios = [], []
+    for m in all_matches:
+        if m.get('status') in LIVE_STATUSES:
+            ft = m.get("score", {}).get("fullTime", {})
+            minute = m.get("minute", "N/A")
+            if m.get('status') == 'HALF_TIME': minute = "Intervalo"
+            jogos.append({
+                "Mandante_Nome": m.get("homeTeam", {}).get("name", ""),
+                "Visitante_Nome": m.get("awayTeam", {}).get("name", ""),
+                "Placar_Mandante": ft.get("home", 0), "Placar_Visitante": ft.get("away", 0),
+                "Tempo_Jogo": minute, "Matchday": safe_int(m.get("matchday", 0))
+            })
+        elif m.get('status') in ['SCHEDULED', 'TIMED'] and m.get('utcDate'):
+            inicios.append(datetime.fromisoformat(m['utcDate'].replace("Z", "+00:00")))
+    return jogos, sorted(inicios)
+
+async def atualizar_live(aba_code, prioridade=PRIORIDADE_INTERATIVA):
+    async def buscar():
+        anterior = LIVE_SNAPSHOT.get(aba_code, {})
+        try:
+            jogos, inicios = await consultar_jogos_live(aba_code, prioridade)
+            snap = {"jogos": jogos, "inicios": inicios, "timestamp": datetime.now(timezone.utc), "erro": None}
+        except Exception as e:
+            registrar_erro(f"jogos_ao_vivo({aba_code})", e)
+            snap = {"jogos": anterior.get("jogos", []), "inicios": anterior.get("inicios", []), "timestamp": datetime.now(timezone.utc), "erro": str(e)}
+        LIVE_SNAPSHOT[aba_code] = snap
+        return snap
+    return await single_flight(("live", aba_code), buscar)
+
+def live_vencido(aba_code, agora):
+    snap = LIVE_SNAPSHOT.get(aba_code)
+    if not snap: return True
+    inicio_recente = any(agora - timedelta(hours=3) <= i <= agora + timedelta(minutes=1) for i in snap["inicios"])
+    ativo = bool(snap["jogos"]) or inicio_recente or snap["erro"] is not None
+    return (agora - snap["timestamp"]).total_seconds() >= (LIVE_POLL_SECONDS if ativo else LIVE_IDLE_SECONDS)
+
+async def job_placar_ao_vivo(context: ContextTypes.DEFAULT_TYPE = None):
+    agora = datetime.now(timezone.utc)
+    vencidas = [aba for aba in LIGAS_MAP if live_vencido(aba, agora)]
+    if vencidas: await asyncio.gather(*(atualizar_live(aba, PRIORIDADE_AO_VIVO) for aba in vencidas))
+
+async def buscar_jogos_live(league_code):
+    """Jogos ao vivo do snapshot; se estiver velho, uma única consulta é feita para todos que pedirem juntos."""
+    snap = LIVE_SNAPSHOT.get(league_code)
+    validade = LIVE_TICK_SECONDS if snap and snap["erro"] else LIVE_POLL_SECONDS  # após erro, tenta de novo mais cedo
+    if not snap or (datetime.now(timezone.utc) - snap["timestamp"]).total_seconds() >= validade:
+        snap = await atualizar_live(league_code)
+    if snap["erro"]: raise RuntimeError(snap["erro"])
+    return snap["jogos"]
+
+# 🔁 SINCRONIZAÇÃO INCREMENTAL (marca d'água por liga)
+SYNC_MARGEM_DIAS = 3  # revisita alguns dias antes da marca (resultados lançados com atraso, jogos remarcados)
+SYNC_HORIZONTE_DIAS = 365  # agenda (_FJ): de hoje até aqui; a parte já jogada da temporada não é baixada de novo
+SYNC_MARCAS = {}  # aba -> {"data": date, "id": int | None} do último jogo finalizado já gravado
+
+def marca_dagua(aba_code):
+    """Marca d'água da liga: memória, depois SQLite; na primeira vez é semeada pela data mais recente já presente na aba."""
+    if aba_code not in SYNC_MARCAS:
+        marca = espelho_seguro(db_ler_marca, aba_code)
+        if marca: SYNC_MARCAS[aba_code] = marca
+        else:
+            partidas = get_indice(aba_code)["partidas"]
+            if partidas: SYNC_MARCAS[aba_code] = {"data": partidas[-1].data.date(), "id": None}
+    return SYNC_MARCAS.get(aba_code)
+
+def mesclar_cache(aba_code, registros):
+    """Acrescenta linhas novas ao SHEET_CACHE da liga (reconstruindo índice e motor) em vez de descartá-lo;
+    jogos (mandante, visitante, data) que o índice já tem são ignorados."""
+    entrada = SHEET_CACHE.get(LIGAS_MAP[aba_code]['sheet_past'])
+    if entrada is None: return  # nada em memória: a próxima leitura carrega tudo
+    chaves = {(p.mandante, p.visitante, p.data_txt) for p in entrada['indice']['partidas']}
+    novos = [r for r in registros if (str(r['Mandante']), str(r['Visitante']), str(r['Data'])) not in chaves]
+    if novos: guardar_passado(aba_code, entrada['data'] + novos, entrada['timestamp'])
+
+def normalizar_linha(valores):
+    return ["" if v is None else str(v) for v in valores]
+
+def diff_futuros(atuais, novos):
+    """Compara a aba _FJ atual (sem cabeçalho) com os jogos da API pela chave (mandante, visitante).
+    Devolve [(linha_da_planilha, valores)] só das linhas que mudam; jogos que saíram viram linhas vazias reaproveitáveis."""
+    posicao, livres, mudancas = {}, [], {}
+    for i, r in enumerate(atuais):
+        r = normalizar_linha((r + [""] * 4)[:4])
+        if r[0] or r[1]: posicao[(r[0], r[1])] = (i + 2, r)
+        else: livres.append(i + 2)
+    inserir = []
+    for bruto in novos:
+        novo, valores = normalizar_linha(bruto), ["" if v is None else v for v in bruto]  # compara como texto, grava com o tipo original
+        atual = posicao.pop((novo[0], novo[1]), None)
+        if atual is None: inserir.append(valores)
+        elif atual[1] != novo: mudancas[atual[0]] = valores
+    for linha, _ in posicao.values():  # não estão mais agendados
+        mudancas[linha] = [""] * 4
+        livres.append(linha)
+    livres.sort()
+    proxima = len(atuais) + 2
+    for novo in inserir:
+        if livres: linha = livres.pop(0)
+        else: linha, proxima = proxima, proxima + 1
+        mudancas[linha] = novo
+    return sorted(mudancas.items())
+
+def gravar_ligas(resultados):
+    """Grava o que veio da API para todas as ligas com uma leitura e uma escrita em lote na planilha;
+    depois atualiza espelho SQLite, SHEET_CACHE e marcas d'água."""
+    novos_por_liga, leituras = {}, {}
+    for aba_code, jogos_fin, futuros in resultados:
+        cfg = LIGAS_MAP[aba_code]
+        if jogos_fin:
+            keys = {(p.mandante, p.visitante, p.data_txt) for p in get_indice(aba_code)["partidas"]}
+            novos = [j for j in jogos_fin if (j["Mandante"], j["Visitante"], j["Data"]) not in keys]
+            if novos:
+                novos_por_liga[aba_code] = novos
+                leituras[cfg['sheet_past']] = intervalo(cfg['sheet_past'], "A:A")  # só para achar a próxima linha livre
+        if futuros is not None: leituras[cfg['sheet_future']] = intervalo(cfg['sheet_future'])
+    for titulo in leituras: aba_ws(titulo)  # aba inexistente falha antes de qualquer escrita
+    valores = dict(zip(leituras, ler_intervalos(list(leituras.values())))) if leituras else {}
 
-async def atualizar_planilhas(context: ContextTypes.DEFAULT_TYPE = None):
-    if not client: return False
+    escritas, linhas_futuras = [], {}
+    for aba_code, jogos_fin, futuros in resultados:
+        cfg = LIGAS_MAP[aba_code]
+        if aba_code in novos_por_liga:
+            ocupadas = len(valores[cfg['sheet_past']])
+            if ocupadas == 0: escritas.append((cfg['sheet_past'], 1, [COLUNAS_PASSADO])); ocupadas = 1
+            escritas.append((cfg['sheet_past'], ocupadas + 1, [[j[c] for c in COLUNAS_PASSADO] for j in novos_por_liga[aba_code]]))
+        if futuros is not None:
+            atuais = valores[cfg['sheet_future']]
+            linhas = [[m.get("homeTeam", {}).get("name"), m.get("awayTeam", {}).get("name"), m.get('utcDate'), m.get("matchday")] for m in futuros]
+            mudancas = diff_futuros(atuais[1:], linhas)
+            if not atuais or normalizar_linha(atuais[0][:4]) != CABECALHO_FUTURO: mudancas.insert(0, (1, CABECALHO_FUTURO))
+            escritas.extend((cfg['sheet_future'], linha, [vals]) for linha, vals in mudancas)
+            linhas_futuras[aba_code] = linhas
+    escrever_intervalos(escritas)
+
+    for aba_code, jogos_fin, futuros in resultados:
+        if aba_code in novos_por_liga:
+            registros = [{c: j[c] for c in COLUNAS_PASSADO} for j in novos_por_liga[aba_code]]
+            espelho_seguro(db_gravar_passado, aba_code, registros)
+            mesclar_cache(aba_code, registros)
+        if jogos_fin:
+            ultimo = jogos_fin[-1]
+            data_ultimo = datetime.strptime(ultimo["Data"], "%d/%m/%Y").date()
+            marca = SYNC_MARCAS.get(aba_code)
+            if not marca or data_ultimo >= marca["data"]:
+                SYNC_MARCAS[aba_code] = {"data": data_ultimo, "id": ultimo["ID"]}
+                espelho_seguro(db_gravar_marca, aba_code, SYNC_MARCAS[aba_code])
+        if aba_code in linhas_futuras:
+            espelho_seguro(db_gravar_futuros, aba_code, linhas_futuras[aba_code])
+            guardar_futuros(aba_code, jogos_futuros([normalizar_linha(l) for l in linhas_futuras[aba_code]]))
+
+async def buscar_liga(aba_code, completo=False):
+    marca = None if completo else await em_thread(EXECUTOR_SHEETS, marca_dagua, aba_code)
+    hoje = datetime.now(timezone.utc).date()
+    janela = (marca["data"] - timedelta(days=SYNC_MARGEM_DIAS), hoje) if marca else None
+    agenda = (hoje, hoje + timedelta(days=SYNC_HORIZONTE_DIAS))  # SCHEDULED/TIMED filtrados aqui: a API aceita um só status
+    jogos_fin, futuros = await asyncio.gather(buscar_jogos(aba_code, "FINISHED", janela), buscar_jogos(aba_code, "ALL", agenda))
+    return aba_code, jogos_fin, futuros
+
+def reimportar_planilha(ligas):
+    """Base do sync completo: relê as abas das ligas para cache e SQLite (corrige espelho errado ou edição manual
+    na aba) e esquece as marcas d'água delas, antes de comparar com a temporada da API. As entradas antigas seguem
+    servindo até a troca; outras ligas (e seus resultados no RENDER_CACHE, versionados por liga) não são tocadas."""
+    with _CARGA_LOCK:
+        descartar_planilha()
+        carregar_da_planilha(ligas)
+    for aba_code in ligas: SYNC_MARCAS.pop(aba_code, None)
+
+SYNC_TRAVAS = {}  # aba -> asyncio.Lock: uma sincronização por liga de cada vez (jobs, FORCE_UPDATE, /sincronizar)
+_SYNC_LOOP = None
+
+def trava_sync(aba_code):
+    global _SYNC_LOOP
+    loop = asyncio.get_running_loop()
+    if loop is not _SYNC_LOOP: SYNC_TRAVAS.clear(); _SYNC_LOOP = loop  # Lock pertence ao loop em que foi usado
+    return SYNC_TRAVAS.setdefault(aba_code, asyncio.Lock())
+
+async def atualizar_planilhas(context: ContextTypes.DEFAULT_TYPE = None, completo=False, ligas=None):
+    """Sincroniza as abas com a API (todas as ligas ou só as de `ligas`). Por padrão é incremental: só a janela
+    após a marca d'água de cada liga e só as linhas alteradas; completo=True (/sincronizar) reimporta a planilha
+    e relê a temporada inteira (liga sem marca também relê tudo).
+    O que veio da API é gravado mesmo se outra consulta falhou, mas aí o retorno é False (job tenta de novo mais cedo)."""
+    if not sheets_configurado(): return False
+    ligas = sorted(ligas or LIGAS_MAP)  # travas sempre na mesma ordem: sem deadlock entre syncs sobrepostos
     try: 
-        sh = client.open_by_url(SHEET_URL)
-        for aba_code, aba_config in LIGAS_MAP.items():
-            ws_past = sh.worksheet(aba_config['sheet_past'])
-            jogos_fin = buscar_jogos(aba_code, "FINISHED")
-            if jogos_fin:
-                exist = ws_past.get_all_records()
-                keys = {(r['Mandante'], r['Visitante'], r['Data']) for r in exist}
-                novos = [[j["Mandante"], j["Visitante"], j["Gols Mandante"], j["Gols Visitante"], j["Gols Mandante 1T"], j["Gols Visitante 1T"], j["Gols Mandante 2T"], j["Gols Visitante 2T"], j["Data"]] for j in jogos_fin if (j["Mandante"], j["Visitante"], j["Data"]) not in keys]
-                if novos: ws_past.append_rows(novos)
-            
-            ws_future = sh.worksheet(aba_config['sheet_future'])
-            futuros = buscar_jogos(aba_code, "ALL")
-            ws_future.clear()
-            ws_future.update(values=[['Mandante', 'Visitante', 'Data/Hora', 'Matchday']], range_name='A1:D1')
-            if futuros:
-                linhas = [[m.get("homeTeam", {}).get("name"), m.get("awayTeam", {}).get("name"), m.get('utcDate'), m.get("matchday")] for m in futuros]
-                ws_future.append_rows(linhas)
-        global SHEET_CACHE
-        SHEET_CACHE = {} # Limpa cache após atualizar
-        return True
-    except: return False
+        async with AsyncExitStack() as travas:
+            # a trava cobre índice lido -> API -> escrita na planilha -> mescla: dois syncs da liga não gravam o mesmo jogo
+            for aba_code in ligas: await travas.enter_async_context(trava_sync(aba_code))
+            if completo: await em_thread(EXECUTOR_SHEETS, reimportar_planilha, ligas)
+            resultados = await asyncio.gather(*(buscar_liga(aba_code, completo) for aba_code in ligas))
+            await em_thread(EXECUTOR_SHEETS, gravar_ligas, resultados)
+        return all(fin is not None and fut is not None for _, fin, fut in resultados)
+    except Exception as e:
+        registrar_erro("atualizar_planilhas", e)
+        descartar_planilha()
+        return False
+
+# 🗓️ AGENDA DE SINCRONIZAÇÃO: um job por liga, escalonado e guiado pelo calendário de jogos da aba _FJ
+SYNC_INTERVALO_JOGO = int(os.environ.get("SYNC_INTERVALO_JOGO", "900"))      # rodada em andamento / falha recente
+SYNC_INTERVALO_FOLGA = int(os.environ.get("SYNC_INTERVALO_FOLGA", "21600"))  # teto sem jogos à vista
+SYNC_ESCALONAMENTO = int(os.environ.get("SYNC_ESCALONAMENTO", "20"))         # defasagem entre ligas, em segundos
+SYNC_DURACAO_JOGO = timedelta(hours=2)  # do apito inicial até o resultado aparecer na API
+
+def inicios_agendados(aba_code):
+    """Horários (UTC) dos jogos da aba _FJ já em memória; não dispara carga."""
+    entrada = SHEET_CACHE.get(LIGAS_MAP[aba_code]['sheet_future'])
+    inicios = []
+    for j in (entrada or {}).get('data', []):
+        try: inicios.append(datetime.fromisoformat(str(j["Data_Hora"]).replace("Z", "+00:00")))
+        except ValueError: continue
+    return sorted(i if i.tzinfo else i.replace(tzinfo=timezone.utc) for i in inicios)
+
+def proximo_intervalo(aba_code, ok=True, agora=None):
+    """Segundos até a próxima sincronização: curto com jogo rolando ou terminando, senão acorda quando
+    o próximo jogo deve acabar (limitado a SYNC_INTERVALO_FOLGA)."""
+    if not ok: return SYNC_INTERVALO_JOGO
+    agora = agora or datetime.now(timezone.utc)
+    inicios = inicios_agendados(aba_code)
+    if any(agora - SYNC_DURACAO_JOGO * 2 <= i <= agora for i in inicios): return SYNC_INTERVALO_JOGO
+    proximo = next((i for i in inicios if i > agora), None)
+    espera = (proximo + SYNC_DURACAO_JOGO - agora).total_seconds() if proximo else SYNC_INTERVALO_FOLGA
+    return min(max(espera, SYNC_INTERVALO_JOGO), SYNC_INTERVALO_FOLGA)
+
+def alinhar_fase(aba_code, espera_s, agora=None):
+    """Segundos até o primeiro horário, a partir de agora + espera_s, que caia na fase fixa da liga.
+    Cada liga tem seu lugar em um ciclo de SYNC_ESCALONAMENTO × nº de ligas contado a partir da época
+    Unix: a defasagem entra uma vez só, como fase, e não se acumula a cada reagendamento."""
+    agora = (agora or datetime.now(timezone.utc)).timestamp()
+    ciclo = SYNC_ESCALONAMENTO * len(LIGAS_MAP)
+    fase = list(LIGAS_MAP).index(aba_code) * SYNC_ESCALONAMENTO
+    if ciclo <= 0: return espera_s
+    alvo = agora + espera_s
+    return alvo + (fase - alvo) % ciclo - agora
+
+async def job_atualizar_liga(context: ContextTypes.DEFAULT_TYPE):
+    aba_code = context.job.data
+    if trava_sync(aba_code).locked():  # /sincronizar em curso para a liga: pula esta vez em vez de enfileirar outra
+        intervalo_s = alinhar_fase(aba_code, 1)
+        context.job_queue.run_once(job_atualizar_liga, intervalo_s, data=aba_code, name=f"sync:{aba_code}")
+        logging.info(f"🗓️ {aba_code}: sincronização já em andamento; nova tentativa em {intervalo_s:.0f} s")
+        return
+    ok = await atualizar_planilhas(ligas=[aba_code])
+    intervalo_s = alinhar_fase(aba_code, proximo_intervalo(aba_code, ok))
+    context.job_queue.run_once(job_atualizar_liga, intervalo_s, data=aba_code, name=f"sync:{aba_code}")
+    logging.info(f"🗓️ {aba_code}: sincronização ok={ok}; próxima em {intervalo_s / 60:.0f} min")
+
+def agendar_sincronizacoes(job_queue):
+    for aba_code in LIGAS_MAP:
+        job_queue.run_once(job_atualizar_liga, alinhar_fase(aba_code, 0), data=aba_code, name=f"sync:{aba_code}")
 
 # 📈 CÁLCULOS
+# Ordem das colunas do motor = chaves do dict de estatísticas (exceto "time").
+# "jogos_casa"/"jogos_fora" nunca foram contabilizados pelo laço original: ficam zerados por compatibilidade.
+METRICAS = ["jogos_time","jogos_casa","jogos_fora","over15","over25","btts","g_a_t","over05_1T","over05_2T","over15_2T","gols_marcados","gols_sofridos","total_gols","gols_marcados_1T","gols_sofridos_1T","gols_marcados_2T","gols_sofridos_2T","marcou_2_mais","sofreu_2_mais","marcou_ambos_tempos","sofreu_ambos_tempos"]
+COL = {m: i for i, m in enumerate(METRICAS)}
+
+def normalizar_variante(ultimos, casa_fora):
+    return (ultimos if ultimos and ultimos > 0 else 0, casa_fora if casa_fora in ("casa", "fora") else None)
+
+def construir_motor(indice):
+    """Monta as colunas NumPy da liga (uma linha por time/partida) e calcula todas as variantes de CONFRONTO_FILTROS."""
+    partidas = indice["partidas"]
+    nomes = sorted(indice["times"])
+    ids = {n: i for i, n in enumerate(nomes)}
+    n = len(partidas)
+
+    gm = np.fromiter((p.gm for p in partidas), dtype=np.int64, count=n)
+    gv = np.fromiter((p.gv for p in partidas), dtype=np.int64, count=n)
+    gm1 = np.fromiter((p.gm1 for p in partidas), dtype=np.int64, count=n)
+    gv1 = np.fromiter((p.gv1 for p in partidas), dtype=np.int64, count=n)
+    id_m = np.fromiter((ids[p.mandante] for p in partidas), dtype=np.int64, count=n)
+    id_v = np.fromiter((ids[p.visitante] for p in partidas), dtype=np.int64, count=n)
+    gm2, gv2 = gm - gm1, gv - gv1
+    total, total1, total2 = gm + gv, gm1 + gv1, gm2 + gv2
+
+    # Perspectiva do time: primeiro as n linhas do mandante, depois as n do visitante.
+    # Num jogo contra si mesmo o laço original sempre usa a visão do mandante.
+    em_casa = np.concatenate([np.ones(n, dtype=bool), np.zeros(n, dtype=bool)])
+    auto = np.tile(id_m == id_v, 2)
+    visao_casa = em_casa | auto
+    time_id = np.concatenate([id_m, id_v])
+    ordem = np.tile(np.arange(n), 2)
+    GM, GV, GM1, GV1, GM2, GV2 = (np.tile(x, 2) for x in (gm, gv, gm1, gv1, gm2, gv2))
+    marc, sofr = np.where(visao_casa, GM, GV), np.where(visao_casa, GV, GM)
+    m1, s1 = np.where(visao_casa, GM1, GV1), np.where(visao_casa, GV1, GM1)
+    m2, s2 = np.where(visao_casa, GM2, GV2), np.where(visao_casa, GV2, GM2)
+    tot, tot1, tot2 = np.tile(total, 2), np.tile(total1, 2), np.tile(total2, 2)
+    btts = (GM > 0) & (GV > 0)
+
+    M = np.zeros((2 * n, len(METRICAS)), dtype=np.int64)
+    M[:, COL["jogos_time"]] = 1
+    M[:, COL["over15"]] = tot > 1.5
+    M[:, COL["over25"]] = tot > 2.5
+    M[:, COL["btts"]] = btts
+    M[:, COL["g_a_t"]] = (tot1 > 0) & (tot2 > 0)
+    M[:, COL["over05_1T"]] = tot1 > 0.5
+    M[:, COL["over05_2T"]] = tot2 > 0.5
+    M[:, COL["over15_2T"]] = tot2 > 1.5
+    M[:, COL["gols_marcados"]] = marc
+    M[:, COL["gols_sofridos"]] = sofr
+    M[:, COL["total_gols"]] = tot
+    M[:, COL["gols_marcados_1T"]] = m1
+    M[:, COL["gols_sofridos_1T"]] = s1
+    M[:, COL["gols_marcados_2T"]] = m2
+    M[:, COL["gols_sofridos_2T"]] = s2
+    M[:, COL["marcou_2_mais"]] = marc >= 2
+    M[:, COL["sofreu_2_mais"]] = sofr >= 2
+    M[:, COL["marcou_ambos_tempos"]] = (m1 > 0) & (m2 > 0)
+    M[:, COL["sofreu_ambos_tempos"]] = (s1 > 0) & (s2 > 0)
+
+    # Agrupa por time mantendo a ordem cronológica dentro de cada grupo
+    ord_idx = np.lexsort((ordem, time_id))
+    mando = {
+        "casa": em_casa[ord_idx],
+        "fora": ~em_casa[ord_idx],
+        None: (em_casa | ~auto)[ord_idx],  # jogo contra si mesmo conta uma vez só
+    }
+    motor = {"times": ids, "n_times": len(nomes), "time_id": time_id[ord_idx], "M": M[ord_idx], "mando": mando, "variantes": {}}
+    for _, _, ult, cm, cv in CONFRONTO_FILTROS:
+        calcular_variante(motor, *normalizar_variante(ult, cm))
+        calcular_variante(motor, *normalizar_variante(ult, cv))
+    return motor
+
+def calcular_variante(motor, ultimos, casa_fora, memorizar=True):
+    """Soma as métricas de todos os times de uma vez para (últimos N, mando); resultado memorizado no motor
+    (memorizar=False para N vindo do usuário: não acumula uma matriz por N até a próxima recarga)."""
+    chave = (ultimos, casa_fora)
+    if chave in motor["variantes"]: return motor["variantes"][chave]
+    sel = motor["mando"][casa_fora]
+    t, M, T = motor["time_id"][sel], motor["M"][sel], motor["n_times"]
+    if ultimos:
+        fim_grupo = np.cumsum(np.bincount(t, minlength=T)) - 1
+        sel_ult = (fim_grupo[t] - np.arange(len(t))) < ultimos
+        t, M = t[sel_ult], M[sel_ult]
+    agg = np.zeros((T, len(METRICAS)), dtype=np.int64)
+    np.add.at(agg, t, M)
+    if memorizar: motor["variantes"][chave] = agg
+    return agg
+
 def calcular_estatisticas_time(time, aba, ultimos=None, casa_fora=None):
+    try:
+        motor = get_motor(aba)
+        d = {"time": time, **dict.fromkeys(METRICAS, 0)}
+        tid = motor["times"].get(time)
+        if tid is None: return d
+        linha = calcular_variante(motor, *normalizar_variante(ultimos, casa_fora))[tid]
+        d.update(zip(METRICAS, linha.tolist()))
+        return d
+    except Exception as e:
+        registrar_erro(f"calcular_estatisticas_time({aba})", e)
+        return {"time":time, "jogos_time": 0}
+
+def calcular_estatisticas_time_loop(time, aba, ultimos=None, casa_fora=None):
+    """Implementação de referência (laço por partida), usada para conferir o motor vetorizado."""
     d = {"time":time,"jogos_time":0,"jogos_casa":0,"jogos_fora":0,"over15":0,"over25":0,"btts":0,"g_a_t":0,"over05_1T":0,"over05_2T":0,"over15_2T":0,"gols_marcados":0,"gols_sofridos":0,"total_gols":0,"gols_marcados_1T":0,"gols_sofridos_1T":0,"gols_marcados_2T":0,"gols_sofridos_2T":0,"marcou_2_mais":0,"sofreu_2_mais":0,"marcou_ambos_tempos":0,"sofreu_ambos_tempos":0}
 
     try: 
-        linhas = get_sheet_data(aba)
-        if casa_fora == "casa": 
-            linhas = [l for l in linhas if l['Mandante'] == time]
-        elif casa_fora == "fora": 
-            linhas = [l for l in linhas if l['Visitante'] == time]
-        else: 
-            linhas = [l for l in linhas if l['Mandante'] == time or l['Visitante'] == time]
-        
-        linhas.sort(key=lambda x: datetime.strptime(x['Data'], "%d/%m/%Y"))
-        if ultimos and ultimos > 0: linhas = linhas[-ultimos:]
-        
-        for l in linhas:
-            em_casa = (time == l['Mandante'])
-            gm, gv = safe_int(l['Gols Mandante']), safe_int(l['Gols Visitante'])
-            gm1, gv1 = safe_int(l['Gols Mandante 1T']), safe_int(l['Gols Visitante 1T'])
+        for l in jogos_do_time(time, aba, ultimos, casa_fora):
+            em_casa = (time == l.mandante)
+            gm, gv = l.gm, l.gv
+            gm1, gv1 = l.gm1, l.gv1
             gm2, gv2 = gm-gm1, gv-gv1
             total, total1, total2 = gm+gv, gm1+gv1, gm2+gv2
             
@@ -278,24 +1097,133 @@ def formatar_estatisticas(d):
 
 def listar_ultimos_jogos(time, aba, ultimos=None, casa_fora=None):
     try:
-        linhas = get_sheet_data(aba)
-        if casa_fora == "casa": linhas = [l for l in linhas if l['Mandante'] == time]
-        elif casa_fora == "fora": linhas = [l for l in linhas if l['Visitante'] == time]
-        else: linhas = [l for l in linhas if l['Mandante'] == time or l['Visitante'] == time]
-        linhas.sort(key=lambda x: datetime.strptime(x['Data'], "%d/%m/%Y"))
-        if ultimos and ultimos > 0: linhas = linhas[-ultimos:]
+        linhas = jogos_do_time(time, aba, ultimos, casa_fora)
         if not linhas: return "Nenhum jogo encontrado."
         texto = ""
         for l in linhas:
-            gm, gv = safe_int(l['Gols Mandante']), safe_int(l['Gols Visitante'])
-            cor = "🟢" if (l['Mandante'] == time and gm > gv) or (l['Visitante'] == time and gv > gm) else ("🟡" if gm == gv else "🔴")
-            texto += f"{cor} {l['Data']}: {l['Mandante']} {gm}x{gv} {l['Visitante']}\n"
+            gm, gv = l.gm, l.gv
+            cor = "🟢" if (l.mandante == time and gm > gv) or (l.visitante == time and gv > gm) else ("🟡" if gm == gv else "🔴")
+            texto += f"{cor} {l.data_txt}: {l.mandante} {gm}x{gv} {l.visitante}\n"
         return texto
-    except: return "Erro ao buscar resultados."
+    except Exception as e:
+        registrar_erro(f"listar_ultimos_jogos({aba})", e)
+        return "Erro ao buscar resultados."
+
+# 🧠 CACHE DE RESULTADOS PRONTOS (LRU versionado)
+def render_cache(chave, gerar):
+    if chave in RENDER_CACHE:
+        RENDER_CACHE.move_to_end(chave)
+        return RENDER_CACHE[chave]
+    valor = gerar()
+    RENDER_CACHE[chave] = valor
+    if len(RENDER_CACHE) > RENDER_CACHE_MAX: RENDER_CACHE.popitem(last=False)
+    return valor
+
+def versao_dados(aba):
+    """Versão atual dos dados da liga, ou None se a planilha não pôde ser carregada (resultado não deve ir pro cache)."""
+    try: return entrada_passado(aba)['versao']  # recarrega se expirado, o que já dá nova versão à liga
+    except Exception as e:
+        registrar_erro(f"versao_dados({aba})", e)
+        return None
+
+def estatisticas_filtro(time, aba, idx, lado):
+    """(dict, Markdown) do time no filtro CONFRONTO_FILTROS[idx]; lado "m" usa o mando do mandante, "v" o do visitante."""
+    _, _, ult, cm, cv = CONFRONTO_FILTROS[idx]
+    def gerar():
+        d = calcular_estatisticas_time(time, aba, ultimos=ult, casa_fora=cm if lado == "m" else cv)
+        return d, formatar_estatisticas(d)
+    versao = versao_dados(aba)
+    if versao is None: return gerar()
+    return render_cache(("stats", aba, time, idx, lado, versao), gerar)
+
+def resultados_filtro(time, aba, idx, lado):
+    _, _, ult, cm, cv = CONFRONTO_FILTROS[idx]
+    gerar = lambda: listar_ultimos_jogos(time, aba, ultimos=ult, casa_fora=cm if lado == "m" else cv)
+    versao = versao_dados(aba)
+    if versao is None: return gerar()
+    return render_cache(("resultados", aba, time, idx, lado, versao), gerar)
+
+# 🏅 RANKING DA LIGA E CONFRONTO DIRETO (agregados do motor e índice de pares de times)
+# métrica -> (rótulo de formatar_estatisticas, "pct" ou "media")
+RANKING_METRICAS = {
+    "over05_1T": ("⚽ Over 0.5 1T", "pct"), "over05_2T": ("⚽ Over 0.5 2T", "pct"), "over15_2T": ("⚽ Over 1.5 2T", "pct"),
+    "over15": ("⚽ Over 1.5 Total", "pct"), "over25": ("⚽ Over 2.5 Total", "pct"), "btts": ("🔁 BTTS", "pct"),
+    "g_a_t": ("🥅 G.A.T", "pct"), "marcou_2_mais": ("📈 Marcou 2+", "pct"), "sofreu_2_mais": ("📉 Sofreu 2+", "pct"),
+    "marcou_ambos_tempos": ("⚽ M.A.T", "pct"), "sofreu_ambos_tempos": ("🥅 S.A.T", "pct"),
+    "gols_marcados": ("✅ Gols Marcados", "media"), "gols_sofridos": ("❌ Gols Sofridos", "media"),
+    "gols_marcados_1T": ("🕐 Marcados 1T", "media"), "gols_sofridos_1T": ("🕐 Sofridos 1T", "media"),
+    "gols_marcados_2T": ("🕑 Marcados 2T", "media"), "gols_sofridos_2T": ("🕑 Sofridos 2T", "media"),
+    "total_gols": ("🏁 MÉDIA TOTAL", "media"),
+}
+RANKING_TOP = 20
+
+def ranking(aba, metrica, ultimos=None, casa_fora=None, crescente=False):
+    """[(time, valor por jogo, jogos)] de todos os times da liga ordenados pela métrica, a partir da variante do motor."""
+    motor = get_motor(aba)
+    agg = calcular_variante(motor, *normalizar_variante(ultimos, casa_fora), memorizar=False)  # as de CONFRONTO_FILTROS já estão no motor
+    jogos = agg[:, COL["jogos_time"]]
+    valores = np.divide(agg[:, COL[metrica]], jogos, out=np.zeros(len(jogos)), where=jogos > 0)
+    ordem = np.lexsort((-jogos, valores if crescente else -valores))  # empate: quem tem mais jogos primeiro
+    nomes = sorted(motor["times"], key=motor["times"].get)
+    return [(nomes[i], float(valores[i]), int(jogos[i])) for i in ordem if jogos[i] > 0]
+
+def formatar_ranking(aba, metrica, ultimos, casa_fora, crescente):
+    rotulo, tipo = RANKING_METRICAS[metrica]
+    linhas = ranking(aba, metrica, ultimos, casa_fora, crescente)[:RANKING_TOP]
+    if not linhas: return f"⚠️ **Nenhum jogo encontrado** em **{aba}**."
+    filtro = ", ".join(x for x in (casa_fora, f"últimos {ultimos}" if ultimos else None, "crescente" if crescente else None) if x)
+    texto = f"🏆 **Ranking {aba} - {rotulo}**" + (f" ({filtro})" if filtro else "") + "\n"
+    for pos, (time, valor, jt) in enumerate(linhas, 1):
+        texto += f"{pos}. {escape_markdown(time)}: **{f'{valor * 100:.1f}%' if tipo == 'pct' else f'{valor:.2f}'}** ({jt} j)\n"
+    return texto
+
+def limitar_ultimos(motor, ultimos, casa_fora):
+    """N maior ou igual ao máximo de jogos de um time nesse mando equivale a "todos" (0)."""
+    maximo = calcular_variante(motor, 0, casa_fora)[:, COL["jogos_time"]].max(initial=0)
+    return 0 if ultimos >= maximo else ultimos
+
+def ranking_cache(aba, metrica, ultimos=None, casa_fora=None, crescente=False):
+    ultimos, casa_fora = normalizar_variante(ultimos, casa_fora)
+    versao = versao_dados(aba)
+    if versao is None: return formatar_ranking(aba, metrica, ultimos, casa_fora, crescente)
+    ultimos = limitar_ultimos(get_motor(aba), ultimos, casa_fora)
+    gerar = lambda: formatar_ranking(aba, metrica, ultimos, casa_fora, crescente)
+    return render_cache(("ranking", aba, metrica, ultimos, casa_fora, crescente, versao), gerar)
+
+def confronto_direto(time_a, time_b, aba, ultimos=None):
+    """Jogos entre os dois times (qualquer mando), em ordem cronológica, pelo índice de pares."""
+    jogos = get_indice(aba)["confrontos"].get(chave_confronto(time_a, time_b), [])
+    return jogos[-ultimos:] if ultimos and ultimos > 0 else list(jogos)
+
+def formatar_confronto(time_a, time_b, aba, ultimos=None):
+    jogos = confronto_direto(time_a, time_b, aba, ultimos)
+    titulo = f"🤝 **Confronto direto - {escape_markdown(time_a)} x {escape_markdown(time_b)}**\n"
+    if not jogos: return titulo + "Nenhum jogo encontrado."
+    va = vb = emp = over25 = btts = gols = 0
+    texto = ""
+    for l in jogos:
+        ga, gb = (l.gm, l.gv) if l.mandante == time_a else (l.gv, l.gm)
+        va, vb, emp = va + (ga > gb), vb + (gb > ga), emp + (ga == gb)
+        over25, btts, gols = over25 + (l.gm + l.gv > 2.5), btts + (l.gm > 0 and l.gv > 0), gols + l.gm + l.gv
+        cor = "🟢" if ga > gb else ("🟡" if ga == gb else "🔴")
+        texto += f"{cor} {l.data_txt}: {l.mandante} {l.gm}x{l.gv} {l.visitante}\n"
+    jt = len(jogos)
+    return (
+        titulo +
+        f"📅 Jogos: {jt} | ✅ {escape_markdown(time_a)}: {va} | 🟡 Empates: {emp} | ✅ {escape_markdown(time_b)}: {vb}\n"
+        f"⚽ Over 2.5: **{pct(over25, jt)}** | 🔁 BTTS: **{pct(btts, jt)}** | 🏁 Média de gols: **{media(gols, jt)}**\n"
+        f"---\n{texto}"
+    )
+
+def confronto_cache(time_a, time_b, aba):
+    gerar = lambda: formatar_confronto(time_a, time_b, aba)
+    versao = versao_dados(aba)
+    if versao is None: return gerar()
+    return render_cache(("confronto", aba, time_a, time_b, versao), gerar)
 
 # 🤖 HANDLERS
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("👋 Bem-vindo!\nUse **/stats** para começar.", parse_mode='Markdown')
+    await update.message.reply_text("👋 Bem-vindo!\nUse **/stats** para começar ou **/ranking** para comparar os times de uma liga.", parse_mode='Markdown')
 
 async def listar_competicoes(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [[InlineKeyboardButton(aba, callback_data=f"c|{aba}")] for aba in LIGAS_MAP.keys()]
@@ -311,67 +1239,312 @@ async def mostrar_menu_status_jogo(update: Update, context: ContextTypes.DEFAULT
                 [InlineKeyboardButton("⬅️ Voltar", callback_data="VOLTAR_LIGA")]]
     await update.callback_query.edit_message_text(f"**{aba_code}** - Escolha:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
 
+# 🎫 TABELA DE JOGOS: compartilhada pelo processo; o callback_data leva um ID estável (hash de liga/mandante/visitante)
+JOGOS_TTL = timedelta(days=2)  # jogo que sumiu das listas sai da tabela depois disso
+CHAT_REF_TTL = 3600  # segundos que o jogo aberto no chat vale para botões antigos sem ID
+TABELA_JOGOS = {}  # id -> {"aba", "mandante", "visitante", "visto": datetime}
+LISTAS_JOGOS = {}  # (aba, status) -> {"ids": tuple, "teclado": InlineKeyboardMarkup}
+
+def id_jogo(aba_code, mandante, visitante):
+    return hashlib.blake2b(f"{aba_code}|{mandante}|{visitante}".encode("utf-8"), digest_size=5).hexdigest()
+
+def registrar_jogos(aba_code, jogos):
+    agora = datetime.now()
+    ids = []
+    for j in jogos:
+        jid = id_jogo(aba_code, j['Mandante_Nome'], j['Visitante_Nome'])
+        TABELA_JOGOS[jid] = {"aba": aba_code, "mandante": j['Mandante_Nome'], "visitante": j['Visitante_Nome'], "visto": agora}
+        ids.append(jid)
+    for jid in [k for k, v in TABELA_JOGOS.items() if agora - v["visto"] > JOGOS_TTL]: del TABELA_JOGOS[jid]
+    return ids
+
+def teclado_jogos(aba_code, status, jogos):
+    """Teclado da lista (o mesmo objeto para todos os chats); só é refeito quando a sequência de IDs muda.
+    Botões antigos não dependem disso: o ID é estável e resolver_jogo o encontra enquanto o jogo existir."""
+    ids = tuple(registrar_jogos(aba_code, jogos[:MAX_GAMES_LISTED]))
+    lista = LISTAS_JOGOS.get((aba_code, status))
+    if lista is None or lista["ids"] != ids:
+        keyboard = [[InlineKeyboardButton(f"{TABELA_JOGOS[jid]['mandante']} x {TABELA_JOGOS[jid]['visitante']}", callback_data=f"J|{aba_code}|{jid}")] for jid in ids]
+        keyboard.append([InlineKeyboardButton("⬅️ Voltar", callback_data=f"VOLTAR_LIGA_STATUS|{aba_code}")])
+        lista = LISTAS_JOGOS[(aba_code, status)] = {"ids": ids, "teclado": InlineKeyboardMarkup(keyboard)}
+    return lista["teclado"]
+
+async def resolver_jogo(aba_code, jid):
+    """Jogo pelo ID; se a tabela não o tem (reinício ou limpeza), recarrega as listas da liga antes de desistir."""
+    if aba_code not in LIGAS_MAP: return None
+    if jid not in TABELA_JOGOS:
+        registrar_jogos(aba_code, await get_sheet_data_future_async(aba_code))
+        snap = LIVE_SNAPSHOT.get(aba_code)
+        if snap: registrar_jogos(aba_code, snap["jogos"])
+    jogo = TABELA_JOGOS.get(jid)
+    return jogo if jogo and jogo["aba"] == aba_code else None
+
+def jogo_do_chat(context):
+    """Referência do último jogo aberto no chat (para botões de filtro antigos, sem ID)."""
+    ref = context.chat_data.get('jogo')
+    if not ref or time.monotonic() - ref[2] > CHAT_REF_TTL: return None
+    return ref[0], ref[1]
+
+async def jogo_indisponivel(update, aba_code):
+    await update.callback_query.answer("⚠️ Este jogo não está mais na lista.")
+    await update.effective_message.reply_text("⚠️ Jogo não encontrado ou lista expirada. Abra a lista novamente.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Voltar", callback_data=f"VOLTAR_LIGA_STATUS|{aba_code}" if aba_code else "VOLTAR_LIGA")]]))
+
+async def abrir_filtro(update, context, partes):
+    """STATS_FILTRO|idx|aba|id e RESULTADOS_FILTRO|...; botões antigos (só idx) usam a referência do chat."""
+    idx = int(partes[1])
+    if len(partes) >= 4: aba_code, jid = partes[2], partes[3]
+    else: aba_code, jid = jogo_do_chat(context) or (None, None)
+    jogo = await resolver_jogo(aba_code, jid) if jid else None
+    if jogo is None: return await jogo_indisponivel(update, aba_code)
+    context.chat_data['jogo'] = (aba_code, jid, time.monotonic())
+    exibir = exibir_estatisticas if partes[0] == "STATS_FILTRO" else exibir_ultimos_resultados
+    await exibir(update, context, jogo['mandante'], jogo['visitante'], aba_code, idx, jid)
+
+RAMOS_CALLBACK = {"FORCE_UPDATE", "c", "STATUS", "J", "JOGO", "H2H", "STATS_FILTRO", "RESULTADOS_FILTRO", "VOLTAR_LIGA_STATUS", "VOLTAR_LIGA"}
+
 async def callback_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = update.callback_query.data
+    ramo = data.split('|')[0] if data.split('|')[0] in RAMOS_CALLBACK else "outro"
     try:
-        if data == "FORCE_UPDATE":
-            await update.callback_query.answer("🔄 Atualizando planilhas... aguarde.")
-            sucesso = await atualizar_planilhas()
-            msg = "✅ Planilhas atualizadas com sucesso!" if sucesso else "❌ Erro ao atualizar planilhas."
-            await update.callback_query.edit_message_text(msg, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Voltar", callback_data="VOLTAR_LIGA")]]))
+        with cronometro("bot_handler", handler=f"callback:{ramo}"):
+            if data == "FORCE_UPDATE":
+                await update.callback_query.answer("🔄 Atualizando planilhas... aguarde.")
+                sucesso = await atualizar_planilhas()
+                msg = "✅ Planilhas atualizadas com sucesso!" if sucesso else "❌ Erro ao atualizar planilhas."
+                await update.callback_query.edit_message_text(msg, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Voltar", callback_data="VOLTAR_LIGA")]]))
         
-        elif data.startswith("c|"): await mostrar_menu_status_jogo(update, context, data.split('|')[1])
-        elif data.startswith("STATUS|"): await listar_jogos(update, context, data.split('|')[2], data.split('|')[1])
-        elif data.startswith("JOGO|"):
-            _, aba, status, idx = data.split('|')
-            jogo = context.chat_data[f"{aba}_jogos_{status.lower()}"][int(idx)]
-            context.chat_data.update({'current_mandante': jogo['Mandante_Nome'], 'current_visitante': jogo['Visitante_Nome'], 'current_aba_code': aba})
-            await mostrar_menu_acoes(update, context, aba, jogo['Mandante_Nome'], jogo['Visitante_Nome'])
-        elif data.startswith("STATS_FILTRO|"): await exibir_estatisticas(update, context, context.chat_data['current_mandante'], context.chat_data['current_visitante'], context.chat_data['current_aba_code'], int(data.split('|')[1]))
-        elif data.startswith("RESULTADOS_FILTRO|"): await exibir_ultimos_resultados(update, context, context.chat_data['current_mandante'], context.chat_data['current_visitante'], context.chat_data['current_aba_code'], int(data.split('|')[1]))
-        elif data.startswith("VOLTAR_LIGA_STATUS|"): await mostrar_menu_status_jogo(update, context, data.split('|')[1])
-        elif data == "VOLTAR_LIGA": await listar_competicoes(update, context)
-    except: pass
+            elif data.startswith("c|"): await mostrar_menu_status_jogo(update, context, data.split('|')[1])
+            elif data.startswith("STATUS|"): await listar_jogos(update, context, data.split('|')[2], data.split('|')[1])
+            elif data.startswith("J|"):
+                _, aba, jid = data.split('|')
+                jogo = await resolver_jogo(aba, jid)
+                if jogo is None: return await jogo_indisponivel(update, aba)
+                context.chat_data['jogo'] = (aba, jid, time.monotonic())
+                await mostrar_menu_acoes(update, context, aba, jogo['mandante'], jogo['visitante'], jid)
+            elif data.startswith("H2H|"):
+                _, aba, jid = data.split('|')
+                jogo = await resolver_jogo(aba, jid)
+                if jogo is None: return await jogo_indisponivel(update, aba)
+                await exibir_confronto_direto(update, context, jogo['mandante'], jogo['visitante'], aba, jid)
+            elif data.startswith("JOGO|"): await jogo_indisponivel(update, data.split('|')[1])  # botão por posição, anterior à tabela de jogos
+            elif data.startswith(("STATS_FILTRO|", "RESULTADOS_FILTRO|")): await abrir_filtro(update, context, data.split('|'))
+            elif data.startswith("VOLTAR_LIGA_STATUS|"): await mostrar_menu_status_jogo(update, context, data.split('|')[1])
+            elif data == "VOLTAR_LIGA": await listar_competicoes(update, context)
+    except Exception as e: registrar_erro(f"callback:{ramo}", e)
 
 # Restante das funções de exibição (exibir_estatisticas, etc) permanecem idênticas
+@medido("listar_jogos")
 async def listar_jogos(update: Update, context: ContextTypes.DEFAULT_TYPE, aba_code: str, status: str):
-    jogos = get_sheet_data_future(aba_code) if status == "FUTURE" else buscar_jogos_live(aba_code)
+    try: jogos = await get_sheet_data_future_async(aba_code) if status == "FUTURE" else await buscar_jogos_live(aba_code)
+    except Exception as e:
+        registrar_erro(f"listar_jogos({aba_code}, {status})", e)
+        await update.callback_query.edit_message_text("❌ Erro ao consultar os jogos ao vivo. Tente novamente em instantes.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Voltar", callback_data=f"VOLTAR_LIGA_STATUS|{aba_code}")]]))
+        return
     if not jogos:
         await update.callback_query.edit_message_text("⚠️ Nenhum jogo encontrado.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Voltar", callback_data=f"VOLTAR_LIGA_STATUS|{aba_code}")]]), parse_mode='Markdown')
         return
-    context.chat_data[f"{aba_code}_jogos_{status.lower()}"] = jogos
-    keyboard = [[InlineKeyboardButton(f"{j['Mandante_Nome']} x {j['Visitante_Nome']}", callback_data=f"JOGO|{aba_code}|{status}|{idx}")] for idx, j in enumerate(jogos[:MAX_GAMES_LISTED])]
-    keyboard.append([InlineKeyboardButton("⬅️ Voltar", callback_data=f"VOLTAR_LIGA_STATUS|{aba_code}")])
-    await update.callback_query.edit_message_text("Selecione a partida:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+    await update.callback_query.edit_message_text("Selecione a partida:", reply_markup=teclado_jogos(aba_code, status, jogos), parse_mode='Markdown')
 
-async def mostrar_menu_acoes(update: Update, context: ContextTypes.DEFAULT_TYPE, aba_code: str, mandante: str, visitante: str):
-    keyboard = [[InlineKeyboardButton(f[0], callback_data=f"{f[1]}|{i}")] for i, f in enumerate(CONFRONTO_FILTROS)]
+async def mostrar_menu_acoes(update: Update, context: ContextTypes.DEFAULT_TYPE, aba_code: str, mandante: str, visitante: str, jid: str):
+    keyboard = [[InlineKeyboardButton(f[0], callback_data=f"{f[1]}|{i}|{aba_code}|{jid}")] for i, f in enumerate(CONFRONTO_FILTROS)]
+    keyboard.append([InlineKeyboardButton("🤝 Confronto direto", callback_data=f"H2H|{aba_code}|{jid}")])
     keyboard.append([InlineKeyboardButton("⬅️ Voltar para Jogos", callback_data=f"VOLTAR_LIGA_STATUS|{aba_code}")])
     await update.effective_message.reply_text(f"Filtros para: **{mandante} x {visitante}**", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
 
-async def exibir_estatisticas(update: Update, context: ContextTypes.DEFAULT_TYPE, mandante: str, visitante: str, aba_code: str, idx: int):
-    _, _, ult, cm, cv = CONFRONTO_FILTROS[idx]
-    dm = calcular_estatisticas_time(mandante, aba_code, ultimos=ult, casa_fora=cm)
-    dv = calcular_estatisticas_time(visitante, aba_code, ultimos=ult, casa_fora=cv)
-    await update.effective_message.reply_text(f"{formatar_estatisticas(dm)}\n\n---\n\n{formatar_estatisticas(dv)}", parse_mode='Markdown')
-    await mostrar_menu_acoes(update, context, aba_code, mandante, visitante)
+async def aquecer_liga(aba_code):
+    """Carrega a aba fora do event loop; depois disso os cálculos síncronos só leem o cache.
+    Devolve False se a carga falhou: o handler avisa o usuário em vez de cair na carga bloqueante dentro do loop."""
+    try:
+        await get_sheet_data_async(aba_code)
+        return True
+    except Exception as e:
+        registrar_erro(f"aquecer_liga({aba_code})", e)
+        return False
 
-async def exibir_ultimos_resultados(update: Update, context: ContextTypes.DEFAULT_TYPE, mandante: str, visitante: str, aba_code: str, idx: int):
-    _, _, ult, cm, cv = CONFRONTO_FILTROS[idx]
-    rm = listar_ultimos_jogos(mandante, aba_code, ultimos=ult, casa_fora=cm)
-    rv = listar_ultimos_jogos(visitante, aba_code, ultimos=ult, casa_fora=cv)
+async def avisar_falha_carga(update, aba_code):
+    await update.effective_message.reply_text("❌ Erro ao carregar os dados da liga. Tente novamente em instantes.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Voltar", callback_data=f"VOLTAR_LIGA_STATUS|{aba_code}")]]))
+
+@medido("exibir_estatisticas")
+async def exibir_estatisticas(update: Update, context: ContextTypes.DEFAULT_TYPE, mandante: str, visitante: str, aba_code: str, idx: int, jid: str):
+    if not await aquecer_liga(aba_code): return await avisar_falha_carga(update, aba_code)
+    _, tm = estatisticas_filtro(mandante, aba_code, idx, "m")
+    _, tv = estatisticas_filtro(visitante, aba_code, idx, "v")
+    await update.effective_message.reply_text(f"{tm}\n\n---\n\n{tv}", parse_mode='Markdown')
+    await mostrar_menu_acoes(update, context, aba_code, mandante, visitante, jid)
+
+@medido("exibir_ultimos_resultados")
+async def exibir_ultimos_resultados(update: Update, context: ContextTypes.DEFAULT_TYPE, mandante: str, visitante: str, aba_code: str, idx: int, jid: str):
+    if not await aquecer_liga(aba_code): return await avisar_falha_carga(update, aba_code)
+    rm = resultados_filtro(mandante, aba_code, idx, "m")
+    rv = resultados_filtro(visitante, aba_code, idx, "v")
     await update.effective_message.reply_text(f"📅 **Resultados - {mandante}**\n{rm}\n\n📅 **Resultados - {visitante}**\n{rv}", parse_mode='Markdown')
-    await mostrar_menu_acoes(update, context, aba_code, mandante, visitante)
+    await mostrar_menu_acoes(update, context, aba_code, mandante, visitante, jid)
+
+@medido("exibir_confronto_direto")
+async def exibir_confronto_direto(update: Update, context: ContextTypes.DEFAULT_TYPE, mandante: str, visitante: str, aba_code: str, jid: str):
+    if not await aquecer_liga(aba_code): return await avisar_falha_carga(update, aba_code)
+    await update.effective_message.reply_text(confronto_cache(mandante, visitante, aba_code), parse_mode='Markdown')
+    await mostrar_menu_acoes(update, context, aba_code, mandante, visitante, jid)
+
+@medido("sincronizar")
+async def sincronizar_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/sincronizar [LIGA ...]: sync completo (reimporta a planilha para o espelho e relê a temporada na API)."""
+    if not update.effective_user or update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ Comando restrito aos administradores.")
+        return
+    ligas = [a.upper() for a in context.args or []]
+    if any(a not in LIGAS_MAP for a in ligas):
+        await update.message.reply_text(f"Uso: `/sincronizar [liga ...]`\nLigas: `{', '.join(LIGAS_MAP)}`", parse_mode='Markdown')
+        return
+    await update.message.reply_text("🔄 Sincronização completa em andamento... aguarde.")
+    sucesso = await atualizar_planilhas(completo=True, ligas=ligas or None)
+    await update.message.reply_text("✅ Planilha reimportada e sincronizada!" if sucesso else "❌ Erro na sincronização completa.")
+
+@medido("ranking")
+async def ranking_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/ranking <LIGA> <métrica> [casa|fora] [N] [asc]"""
+    args = context.args or []
+    aba = args[0].upper() if args else None
+    metrica = next((m for m in RANKING_METRICAS if len(args) > 1 and m.lower() == args[1].lower()), None)
+    if aba not in LIGAS_MAP or metrica is None:
+        await update.message.reply_text(
+            "Uso: `/ranking <liga> <métrica> [casa|fora] [N] [asc]`\n"
+            f"Ligas: `{', '.join(LIGAS_MAP)}`\nMétricas: `{', '.join(RANKING_METRICAS)}`\n"
+            "Ex.: `/ranking BSA btts casa 10`", parse_mode='Markdown')
+        return
+    extras = [a.lower() for a in args[2:]]
+    casa_fora = next((a for a in extras if a in ("casa", "fora")), None)
+    ultimos = next((int(a) for a in extras if a.isdecimal()), None)
+    if not await aquecer_liga(aba): return await avisar_falha_carga(update, aba)
+    await update.message.reply_text(ranking_cache(aba, metrica, ultimos, casa_fora, "asc" in extras), parse_mode='Markdown')
+
+# 🩺 /perf (admins) E /metrics (Prometheus, porta METRICS_PORT ao lado do webhook)
+def _fmt_rotulos(rotulos):
+    if not rotulos: return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in rotulos) + "}"
+
+def texto_prometheus():
+    with _METRICAS_LOCK:
+        hist = {k: (list(v["buckets"]), v["soma"], v["n"]) for k, v in HISTOGRAMAS.items()}
+        cont = dict(CONTADORES)
+    linhas = []
+    for nome in sorted({n for n, _ in hist}):
+        linhas.append(f"# TYPE {nome} histogram")
+        for (n, rot), (buckets, soma, total) in sorted(hist.items()):
+            if n != nome: continue
+            acumulado = 0
+            for le, c in zip([*map(str, BUCKETS_LATENCIA), "+Inf"], buckets):
+                acumulado += c
+                linhas.append(f"{nome}_bucket{_fmt_rotulos(rot + (('le', le),))} {acumulado}")
+            linhas.append(f"{nome}_sum{_fmt_rotulos(rot)} {soma:.6f}")
+            linhas.append(f"{nome}_count{_fmt_rotulos(rot)} {total}")
+    for nome in sorted({n for n, _ in cont}):
+        linhas.append(f"# TYPE {nome} counter")
+        linhas.extend(f"{n}{_fmt_rotulos(rot)} {v}" for (n, rot), v in sorted(cont.items()) if n == nome)
+    agora = datetime.now()
+    linhas.append("# TYPE bot_sheet_cache_idade_segundos gauge")
+    linhas.extend(f'bot_sheet_cache_idade_segundos{{aba="{aba}"}} {(agora - e["timestamp"]).total_seconds():.0f}' for aba, e in list(SHEET_CACHE.items()))
+    linhas.append("# TYPE bot_inicio_segundos gauge")
+    linhas.extend(f'bot_inicio_segundos{{marco="{marco}"}} {seg:.3f}' for marco, seg in list(MARCOS_INICIO.items()))
+    estado = AGENDADOR_API.estado()
+    for nome, chave in (("bot_api_fila", "fila"), ("bot_api_em_voo", "em_voo"), ("bot_api_tokens", "tokens"), ("bot_api_pausa_segundos", "pausado_por")):
+        linhas.append(f"# TYPE {nome} gauge")
+        linhas.append(f"{nome} {estado[chave]}")
+    return "\n".join(linhas) + "\n"
+
+class MetricasHTTP(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics": return self.send_error(404)
+        corpo = texto_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args): pass
+
+def iniciar_servidor_metricas(porta):
+    servidor = ThreadingHTTPServer(("0.0.0.0", porta), MetricasHTTP)
+    threading.Thread(target=servidor.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"📊 Métricas em http://0.0.0.0:{porta}/metrics")
+    return servidor
+
+def resumo_perf():
+    def ms(v): return "∞" if v == float("inf") else f"≤{v * 1000:.0f}ms"
+    with _METRICAS_LOCK:
+        hist = {k: dict(v, buckets=list(v["buckets"])) for k, v in HISTOGRAMAS.items()}
+        cont = dict(CONTADORES)
+    linhas = []
+    for titulo, nome in (("⏱️ HANDLERS", "bot_handler_segundos"), ("🌐 UPSTREAM", "bot_upstream_segundos")):
+        linhas.append(f"{titulo} (n | p50 | p95 | média)")
+        for (n, rot), h in sorted(hist.items()):
+            if n != nome: continue
+            linhas.append(f"{'/'.join(v for _, v in rot):<28} {h['n']:>6} | {ms(quantil_buckets(h, 0.5)):>8} | {ms(quantil_buckets(h, 0.95)):>8} | {h['soma'] / h['n'] * 1000:.0f}ms")
+    linhas.append("🗂️ SHEET_CACHE (hit% | hits/total | idade)")
+    agora = datetime.now()
+    for aba in sorted({dict(rot)["aba"] for (n, rot) in cont if n == "bot_sheet_cache_total"} | set(SHEET_CACHE)):
+        hits, misses = cont.get(("bot_sheet_cache_total", (("aba", aba), ("resultado", "hit"))), 0), cont.get(("bot_sheet_cache_total", (("aba", aba), ("resultado", "miss"))), 0)
+        entrada = SHEET_CACHE.get(aba)
+        idade = f"{(agora - entrada['timestamp']).total_seconds() / 60:.0f}min" if entrada else "vazio"
+        linhas.append(f"{aba:<12} {pct(hits, hits + misses):>7} | {hits}/{hits + misses} | {idade}")
+    erros = sorted(((v, n, rot) for (n, rot), v in cont.items() if n.endswith("erros_total")), reverse=True)[:10]
+    linhas.append("⚠️ ERROS")
+    linhas.extend(f"{v:>5}x {'/'.join(x for _, x in rot)}" for v, n, rot in erros)
+    if not erros: linhas.append("nenhum")
+    http = {dict(rot)["status"]: v for (n, rot), v in cont.items() if n == "bot_upstream_http_total"}
+    estado = AGENDADOR_API.estado()
+    linhas.append("🚀 INÍCIO " + " | ".join(f"{marco}={seg:.2f}s" for marco, seg in MARCOS_INICIO.items()) + ("" if "aquecimento" in MARCOS_INICIO else " | aquecendo..."))
+    linhas.append(f"🚦 API fila={estado['fila']} em_voo={estado['em_voo']} tokens={estado['tokens']} pausa={estado['pausado_por']}s http={http}")
+    return "\n".join(linhas)
+
+async def perf_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_user or update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ Comando restrito aos administradores.")
+        return
+    await update.message.reply_text(f"```\n{resumo_perf()}\n```", parse_mode='Markdown')
+
+# 🚀 INICIALIZAÇÃO: o webhook sobe já; aquecimento do cache e jobs de sincronização rodam em segundo plano
+AQUECIMENTO = None  # Task do aquecimento (referência forte: o loop só guarda tasks por weakref)
+_ESPERA_WEBHOOK = None  # Task que marca o bind do webhook
+MARCOS_INICIO = {}  # marco -> segundos desde INICIO_PROCESSO ("webhook", "aquecimento", "primeira_resposta")
+
+def marcar_inicio(marco):
+    if marco in MARCOS_INICIO: return
+    MARCOS_INICIO[marco] = time.monotonic() - INICIO_PROCESSO
+    logging.info(f"⏱️ {marco}: {MARCOS_INICIO[marco]:.2f}s após o início do processo")
+
+async def aquecer_em_segundo_plano(app):
+    await pre_carregar_cache_sheets()
+    marcar_inicio("aquecimento")
+    if sheets_configurado(): agendar_sincronizacoes(app.job_queue)
+
+async def marcar_webhook(app):
+    """app.running só vira True em Application.start(), que o PTB chama depois de start_webhook ter feito o bind."""
+    while not app.running: await asyncio.sleep(0.01)
+    marcar_inicio("webhook")
+
+async def pos_inicializacao(app):
+    """post_init do PTB: roda logo antes do bind do webhook, então só dispara as tasks de fundo e retorna."""
+    global AQUECIMENTO, _ESPERA_WEBHOOK
+    AQUECIMENTO = asyncio.create_task(aquecer_em_segundo_plano(app))
+    _ESPERA_WEBHOOK = asyncio.create_task(marcar_webhook(app))
+
+async def registrar_primeira_resposta(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    marcar_inicio("primeira_resposta")  # grupo 99: roda depois do handler que respondeu
 
 def main():
     if not BOT_TOKEN: sys.exit(1)
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    app = ApplicationBuilder().token(BOT_TOKEN).post_init(pos_inicializacao).build()
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("stats", listar_competicoes))
+    app.add_handler(CommandHandler("ranking", ranking_command))
+    app.add_handler(CommandHandler("perf", perf_command))
+    app.add_handler(CommandHandler("sincronizar", sincronizar_command))
     app.add_handler(CallbackQueryHandler(callback_query_handler))
-    if client:
-        app.job_queue.run_repeating(atualizar_planilhas, interval=3600, first=0)
-        asyncio.run(pre_carregar_cache_sheets())
+    app.add_handler(TypeHandler(Update, registrar_primeira_resposta), group=99)
+    app.job_queue.run_repeating(job_placar_ao_vivo, interval=LIVE_TICK_SECONDS, first=5)
+    if METRICS_PORT: iniciar_servidor_metricas(METRICS_PORT)
     webhook_url = os.environ.get("WEBHOOK_URL") or os.environ.get("RENDER_EXTERNAL_URL")
     app.run_webhook(listen="0.0.0.0", port=int(os.environ.get("PORT", "8080")), url_path=BOT_TOKEN, webhook_url=f"{webhook_url}/{BOT_TOKEN}")
 